@@ -70,6 +70,7 @@ tiles = {   0:                                         '  . ',
           512: S.bold(S.magenta(S.on_black(            '512 '))),
          1024: S.underlined(S.bold(S.red(S.on_black(   '1024')))),
          2048: S.underlined(S.bold(S.yellow(S.on_black('2048'))))}
+tiles = {v: S.compile(tile) for v, tile in tiles.items()}
 
 def is_won(board):
     return any(any(2048 <= v for v in row)
@@ -5,6 +5,7 @@ Some code taken from Peter Norvig's forthcoming article for _Beautiful Data_.
 
 import re, string, random, glob, operator, heapq
 from collections import defaultdict
+from functools import reduce
 from math import log10
 
 ################ Utilities
@@ -38,7 +39,7 @@ class Pdist(dict):
         for key,count in data:
             if key != '<S>': key = key.lower()
             self[key] = self.get(key, 0) + int(count)
-        self.N = float(N or sum(self.itervalues()))
+        self.N = float(N or sum(self.values()))
         self.missingfn = missingfn or (lambda k, N: 1./N)
     def __call__(self, key): 
         if key in self: return self[key]/self.N  
@@ -46,7 +47,7 @@ class Pdist(dict):
 
 def datafile(name, sep='\t'):
     "Read key,value pairs from file."
-    for line in file(name):
+    for line in open(name):
         yield line.split(sep)
 
 def avoid_long_words(key, N):
@@ -60,8 +61,15 @@ def avoid_long_words(key, N):
 #Pw  = Pdist(datafile('vocab_canon_cs_3'), NT, avoid_long_words)
 #Pw2 = Pdist(datafile('2gm-common6'), NT)
 NT = 1024908267229 + 1e10 ## Number of tokens -- contractions added
-Pw  = Pdist(datafile('anagrams/contractionmodel.unigram'), NT, avoid_long_words)
-Pw2 = Pdist(datafile('anagrams/contractionmodel.bigram'), NT)
+unigram_file, bigram_file = ('anagrams/contractionmodel.unigram',
+                             'anagrams/contractionmodel.bigram')
+Pw = Pw2 = None  # Loaded on first use, by load(): it takes a while.
+
+def load():
+    global Pw, Pw2
+    if Pw is None:
+        Pw  = Pdist(datafile(unigram_file), NT, avoid_long_words)
+        Pw2 = Pdist(datafile(bigram_file), NT)
 
 #NT = 641241
 #Pw  = Pdist(datafile('vocab_austen'), NT, avoid_long_words)
@@ -77,6 +85,7 @@ Pw2 = Pdist(datafile('anagrams/contractionmodel.bigram'), NT)
 
 def cPw(word, prev):
     "Conditional probability of word, given previous word."
+    if Pw is None: load()
     try:
         return Pw2[prev + ' ' + word]/float(Pw[prev])
     except KeyError:
@@ -93,6 +102,6 @@ import math
 ## -math.log(3.2269955740033603e-10, 2)
 #. 31.529089349780651
 
-## map(Pw, 'when in the course'.split())
+## load(); map(Pw, 'when in the course'.split())
 #. [0.00063480918127341898, 0.008263573669766917, 0.022573582340740989, 0.00017365129903887668]
 
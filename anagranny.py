@@ -8,8 +8,8 @@ Adapted from https://github.com/darius/languagetoys
 Bare start; needs lots of polish, etc..
 """
 
-import re, string, time
-from itertools import permutations, izip_longest
+import re, time
+from itertools import permutations
 
 from anagrams.pdist import cPw
 import sturm
@@ -20,9 +20,9 @@ dict_filename = 'anagrams/wordlist.txt'
 def main(argv):
     source = ' '.join(argv[1:]).lower()
     global dictionary, dictionary_prefixes
-    dictionary, dictionary_prefixes = load(dict_filename, source)
     with sturm.cbreak_mode():
         sturm.render('Collecting words...')
+        dictionary, dictionary_prefixes = load(dict_filename, source)
         run(collect_words(source))
 
 def collect_words(source):
@@ -34,25 +34,34 @@ def collect_words(source):
 def run(words):
     nrows, ncols = sturm.ROWS-1, sturm.COLS-1
     words_width = max(len(word) for word,_ in words) # N.B. assumes >=1 word
+    words_pane = sturm.Pane(0, 0, nrows, words_width)
+    grams_pane = sturm.Pane(0, words_width+1, nrows, ncols-words_width-1)
+    done_pane  = sturm.Pane(nrows, words_width+1, 1, len('--done--'))
 
-    def view():
-        grams_pane = anagrams.top(nrows)
-        for r, (word, gram) in enumerate(izip_longest(words_pane, grams_pane, fillvalue='')):
+    def words_view():
+        for r, (word, _) in enumerate(words[page:page+nrows]):
             if page+r == pos: yield sturm.cursor
-            yield word.ljust(words_width), ' ', ' '.join(gram), '\n'
-        if anagrams.done:
-            yield ' '*words_width, ' ', '--done--'
+            yield word, '\n'
+
+    def grams_view():
+        for gram in anagrams.top(nrows):
+            yield ' '.join(gram), '\n'
 
     pos, new_pos = None, 0
     while True:
         if pos != new_pos % len(words):
             pos = new_pos % len(words)
             page = (pos // nrows) * nrows
-            words_pane = [word for word,_ in words[page:page+nrows]]
-            anagrams = Anagrams(gen_anagrams(words[pos]))
-        sturm.render(view())
+            anagrams = Anagrams(gen_anagrams(*words[pos]))
+            words_pane.show(words_view())
+            grams_pane.show()
+            done_pane.show()
+        sturm.render_panes(words_pane, grams_pane, done_pane)
         key = sturm.get_key(None if anagrams.done else 0)
-        if   key is None:          anagrams.grow()
+        if   key is None:
+            anagrams.grow()
+            grams_pane.show(grams_view())
+            if anagrams.done: done_pane.show('--done--')
         elif key == sturm.esc:     return
         elif key == 'up':          new_pos = pos - 1
         elif key in ('down','\t'): new_pos = pos + 1
@@ -77,7 +86,7 @@ class Anagrams(object):
     def top(self, n):
         return [gram for _,gram in self.results[:n]]
 
-def gen_anagrams((word, rest)):
+def gen_anagrams(word, rest):
     for anagram in extend((word,), '', rest, ''):
         for words in cross_product([dictionary[p] for p in anagram[1:]]):
             words = [anagram[0]] + words
@@ -117,12 +126,10 @@ def load(filename, subject=None):
     "Read in a word-list, one word per line. Prune it wrt subject."
     pigeonholes = {}
     prefixes = set()
-    identity = ''.join(map(chr, range(256)))
-    nonalpha = ''.join(set(identity) - set(string.ascii_lowercase))
     usable = usable_pattern(subject)
     def add(word):
         if not usable(word): return
-        canon = word.lower().translate(identity, nonalpha)
+        canon = nonalpha.sub('', word.lower())
         hole = pigeonhole(canon)
         pigeonholes.setdefault(hole, []).append(word)
         for i in range(1, len(hole)+1):
@@ -134,6 +141,8 @@ def load(filename, subject=None):
     if 'i' not in pigeonholes: add('I')
     return pigeonholes, prefixes
 
+nonalpha = re.compile('[^a-z]+')
+
 def usable_pattern(subject):
     """Return a predicate that accepts words that could be part of an
     anagram of subject. (But a None subject could be anything.) This
@@ -0,0 +1,53 @@
+"""
+What the benchmark modules share: a list of benchmarks to add to,
+their command lines, and the table and JSON file they report in.
+"""
+
+import json, sys
+
+def registry():
+    "Return an empty list of benchmarks, and a decorator adding to it."
+    benchmarks = []
+    def benchmark(fn):
+        benchmarks.append(fn)
+        return fn
+    return benchmarks, benchmark
+
+def parse_flags(doc, argv, defaults):
+    """Return a dict of defaults updated from the flags and values in
+    argv, each converted to its default's type (or left a string, for
+    a default of None); or, given any flag not in defaults, print doc
+    and return None."""
+    flags = dict(defaults)
+    args = argv[1:]
+    while args:
+        flag, value = args[0], args[1] if 1 < len(args) else None
+        if value is None or flag not in flags:
+            print(doc)
+            return None
+        default = defaults[flag]
+        flags[flag] = value if default is None else type(default)(value)
+        args = args[2:]
+    return flags
+
+def report(benchmarks, results, columns=()):
+    """Print a table of results, one row per benchmark, with units per
+    second and then any more columns, as (heading, key) pairs."""
+    print('%-12s %-6s %12s' % ('benchmark', 'unit', 'per sec')
+          + ''.join(' %12s' % heading for heading, _ in columns))
+    for bench in benchmarks:
+        r = results[bench.__name__]
+        print('%-12s %-6s %12.1f' % (bench.__name__, r['unit'], r['per_sec'])
+              + ''.join(' %12s' % ('-' if r[key] is None else '%.1f' % r[key])
+                        for _, key in columns))
+
+def save(filename, results):
+    "Write results as JSON, with the Python version they came from."
+    with open(filename, 'w') as f:
+        json.dump(dict(python=sys.version.split()[0], results=results),
+                  f, indent=1, sort_keys=True)
+
+def load(filename):
+    "Return the results in a file written by save()."
+    with open(filename) as f:
+        return json.load(f)['results']
@@ -0,0 +1,148 @@
+"""
+Time reading and writing DIMACS files, in megabytes per second.
+
+Usage: python -m bench.dimacs [-n REPEATS] [--mb SIZE] [--save FILE]
+
+Writes a random 3-SAT problem of about SIZE megabytes (default 20) to
+a temporary file, and reads it back each way, then writes it out again
+each way, alongside the parser and writer that sat.dimacs used to have.
+--save writes the results as JSON, in the same form as bench.suite's.
+"""
+
+from __future__ import print_function
+from functools import reduce
+import os, random, shutil, sys, tempfile, time
+
+from bench import common
+from sat import dimacs
+
+# A benchmark is a function of the filename returning a function to
+# time, which reads it (or writes what it holds).
+benchmarks, benchmark = common.registry()
+
+@benchmark
+def parse_lines(filename):
+    return lambda: line_at_a_time_load(filename)
+
+@benchmark
+def parse_lists(filename):
+    return lambda: dimacs.load(filename)
+
+@benchmark
+def parse_cnf(filename):
+    return lambda: dimacs.load_cnf(filename)
+
+@benchmark
+def parse_stream(filename):
+    def run():
+        for clause in dimacs.clauses(filename):
+            pass
+    return run
+
+@benchmark
+def parse_cached(filename):
+    dimacs.load_cnf(filename, cache=True)
+    return lambda: dimacs.load_cnf(filename, cache=True)
+
+@benchmark
+def write_lines(filename):
+    nvariables, problem = dimacs.load(filename)
+    def run():
+        with open(filename + '.out', 'w') as f:
+            literal_at_a_time_save_file(f, problem)
+    return run
+
+@benchmark
+def write_lists(filename):
+    nvariables, problem = dimacs.load(filename)
+    return lambda: dimacs.save(filename + '.out', problem)
+
+@benchmark
+def write_stream(filename):
+    return lambda: dimacs.save(filename + '.out', dimacs.clauses(filename))
+
+@benchmark
+def write_gzip(filename):
+    nvariables, problem = dimacs.load(filename)
+    return lambda: dimacs.save(filename + '.out.gz', problem)
+
+def line_at_a_time_load(filename):
+    "The old parser, for comparison."
+    nvariables = None
+    nclauses = None
+    clauses = []
+    clause = []
+    with open(filename) as f:
+        for line in f:
+            if line.startswith('c'):
+                continue
+            if line.startswith('p'):
+                f1, f2, f3, f4 = line.split()
+                nvariables = int(f3)
+                nclauses = int(f4)
+            else:
+                for lit in map(int, line.split()):
+                    if lit == 0:
+                        clauses.append(clause)
+                        clause = []
+                    else:
+                        assert 1 <= abs(lit) <= nvariables
+                        clause.append(lit)
+    if clause:
+        clauses.append(clause)
+    assert nclauses == len(clauses)
+    return nvariables, clauses
+
+def literal_at_a_time_save_file(f, problem):
+    "The old writer, for comparison."
+    nvariables = reduce(max,
+                        (abs(literal) for clause in problem for literal in clause),
+                        0)
+    nclauses = len(problem)
+    print('p cnf', nvariables, nclauses, file=f)
+    for clause in problem:
+        for literal in clause:
+            print(literal, end=' ', file=f)
+        print(0, file=f)
+
+def write_random_3sat(filename, megabytes, nvariables=100000):
+    "Write a random 3-SAT problem of about that size; return its size."
+    rng = random.Random(42)
+    nclauses = int(megabytes * 1e6 / 21) # (About the length of a line.)
+    with open(filename, 'w') as f:
+        f.write('c random 3-SAT\np cnf %d %d\n' % (nvariables, nclauses))
+        for _ in range(nclauses):
+            f.write('%d %d %d 0\n' % tuple(rng.choice((-1, 1)) * rng.randint(1, nvariables)
+                                           for _ in range(3)))
+    return os.path.getsize(filename)
+
+def measure(bench, filename, size, repeats):
+    run = bench(filename)
+    best = None
+    for _ in range(repeats):
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return dict(unit='MB', per_sec=size / 1e6 / best)
+
+def main(argv):
+    flags = common.parse_flags(__doc__, argv, {'-n': 5, '--mb': 20.0, '--save': None})
+    if flags is None:
+        return 2
+
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'random.cnf')
+        size = write_random_3sat(filename, flags['--mb'])
+        results = dict((bench.__name__, measure(bench, filename, size, flags['-n']))
+                       for bench in benchmarks)
+    finally:
+        shutil.rmtree(tmp)
+    common.report(benchmarks, results)
+    if flags['--save']:
+        common.save(flags['--save'], results)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,63 @@
+"""
+Compare Python interpreters on the rendering, SAT and DIMACS benchmarks.
+
+Usage: python -m bench.interpreters [-n REPEATS] PYTHON...
+
+Runs bench.suite, bench.solver and bench.dimacs under each PYTHON (a
+command, like python2.7 or /usr/bin/python3.11) and prints units per
+second side by side, with each interpreter's speed relative to the
+first one's.
+"""
+
+import json, os, subprocess, sys, tempfile
+
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+modules = ['bench.suite', 'bench.solver', 'bench.dimacs']
+
+def run(python, module, repeats):
+    "Run a benchmark module under python; return (version, its results)."
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([python, '-m', module, '-n', str(repeats), '--save', path],
+                                  cwd=here, stdout=devnull)
+        with open(path) as f:
+            saved = json.load(f)
+    finally:
+        os.remove(path)
+    return saved['python'], saved['results']
+
+def main(argv):
+    args = argv[1:]
+    repeats = 5
+    if args[:1] == ['-n'] and 1 < len(args):
+        repeats, args = int(args[1]), args[2:]
+    if not args or any(arg.startswith('-') for arg in args):
+        print(__doc__)
+        return 2
+
+    versions, results = [], []
+    for python in args:
+        merged = {}
+        for module in modules:
+            version, found = run(python, module, repeats)
+            merged.update(found)
+        versions.append(version)
+        results.append(merged)
+
+    names = sorted(results[0])
+    print('%-12s %-6s' % ('benchmark', 'unit')
+          + ''.join('%18s' % ('python ' + version) for version in versions))
+    for name in names:
+        base = results[0][name]['per_sec']
+        cells = []
+        for found in results:
+            per_sec = found.get(name, {}).get('per_sec')
+            cells.append('%18s' % ('-' if per_sec is None else
+                                   '%.0f/s (%.2fx)' % (per_sec, per_sec / base)))
+        print('%-12s %-6s' % (name, results[0][name]['unit']) + ''.join(cells))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
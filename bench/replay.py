@@ -0,0 +1,58 @@
+"""
+Replay a recorded session of a program, headless, and time it.
+
+Usage: python -m bench.replay [--realtime] LOG PROGRAM.py [ARGS...]
+
+Record the session first with
+    STURM_RECORD=LOG python PROGRAM.py ARGS...
+The replay feeds PROGRAM the same input (at full speed, unless
+--realtime) and reports how long it took and how many bytes it
+wrote. If the output differs from the recording's, it says where, and
+the exit status is 1; so you can check a change to the renderer
+against sessions recorded before it.
+"""
+
+import runpy, sys, time
+
+import sturm
+
+def main(argv):
+    args = argv[1:]
+    realtime = args[:1] == ['--realtime']
+    if realtime:
+        args = args[1:]
+    if len(args) < 2:
+        print(__doc__)
+        return 2
+    log, program = args[0], args[1]
+
+    replay = sturm.Replay(log, realtime)
+    backend, sturm.backend = sturm.backend, replay
+    argv, sys.argv = sys.argv, args[1:]
+    outcome = 'finished'
+    start = time.time()
+    try:
+        runpy.run_path(program, run_name='__main__')
+    except SystemExit:
+        pass
+    except EOFError:            # (It wanted more input than was recorded.)
+        outcome = 'ran out of input'
+    finally:
+        elapsed = time.time() - start
+        sturm.backend, sys.argv = backend, argv
+
+    written = ''.join(replay.written)
+    print('%s in %.3f s; wrote %d bytes in %d flushes'
+          % (outcome, elapsed, replay.bytes_written, replay.flushes))
+    if written == replay.recorded:
+        print('Output matches the recording.')
+        return 0
+    at = next((i for i, (a, b) in enumerate(zip(written, replay.recorded)) if a != b),
+              min(len(written), len(replay.recorded)))
+    print('Output differs from the recording at character %d:' % at)
+    print('  recorded: %r' % replay.recorded[at:at+40])
+    print('  replayed: %r' % written[at:at+40])
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,76 @@
+"""
+Time the SAT code behind satgame: loading DIMACS files, checking
+assignments against a problem, and solving problems outright.
+
+Usage: python -m bench.solver [-n REPEATS] [--save FILE]
+
+Reports units per second; --save writes the results as JSON, in the
+same form as bench.suite's.
+"""
+
+import random, sys, time
+
+from bench import common
+from sat import dimacs, sat
+
+filenames = ['sat/trivial.dimacs',
+             'sat/factoring6.dimacs',
+             'sat/factoring2.dimacs',
+             'sat/subsetsum_random.dimacs']
+
+# A benchmark is a function returning (unit, steps), like bench.suite's.
+benchmarks, benchmark = common.registry()
+
+@benchmark
+def load():
+    return 'file', [lambda filename=filename: dimacs.load(filename)
+                    for filename in filenames * 25]
+
+@benchmark
+def check():
+    rng = random.Random(42)
+    steps = []
+    for _, problem in map(dimacs.load, filenames):
+        variables = sat.problem_variables(problem)
+        for _ in range(50):
+            env = {v: rng.random() < .5 for v in variables if rng.random() < .8}
+            steps.append(lambda problem=problem, env=env:
+                         (sat.is_satisfied(problem, env), sat.seems_consistent(problem, env)))
+    return 'check', steps
+
+@benchmark
+def solve():
+    problems = [problem for _, problem in map(dimacs.load, filenames)]
+    rng = random.Random(42)
+    for _ in range(20):
+        problems.append(random_3sat(rng, rng.randint(50, 100)))
+    return 'solve', [lambda problem=problem: sat.solve(problem) for problem in problems]
+
+def random_3sat(rng, nvariables, ratio=4.26):
+    "Return a random 3-SAT problem near the hard satisfiable/unsatisfiable threshold."
+    return [[rng.choice((-1, 1)) * v for v in rng.sample(range(1, nvariables+1), 3)]
+            for _ in range(int(ratio * nvariables))]
+
+def measure(bench, repeats):
+    best = None
+    for _ in range(repeats):
+        unit, steps = bench()
+        start = time.time()
+        for step in steps:
+            step()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return dict(unit=unit, per_sec=len(steps) / best)
+
+def main(argv):
+    flags = common.parse_flags(__doc__, argv, {'-n': 5, '--save': None})
+    if flags is None:
+        return 2
+    results = dict((bench.__name__, measure(bench, flags['-n'])) for bench in benchmarks)
+    common.report(benchmarks, results)
+    if flags['--save']:
+        common.save(flags['--save'], results)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,96 @@
+"""
+Time each example from launch to its first frame on the screen.
+
+Usage: python -m bench.startup [-n REPEATS] [PROGRAM ...]
+
+Each program runs as `python PROGRAM.py ARGS...` on a pseudo-terminal,
+and its time to first frame runs from starting the process to reading
+its first output (sturm sends nothing until the first render). For
+comparison it also times the bare interpreter, and `import sturm`.
+Reports the best of the repeats, in milliseconds, with the startup
+target for the games. To see where the import time goes, try
+    python -X importtime PROGRAM.py
+(Python 3.7 and up).
+"""
+
+import fcntl, os, select, signal, struct, subprocess, sys, termios, time
+
+here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The entry points, with arguments that get them to a first frame
+# without waiting on anything else.
+programs = [('2048', []), ('glutton', []), ('snake', []), ('sokoban', []),
+            ('satgame', []), ('tictactoe', []), ('typingspeed', []),
+            ('cryptogram', ['Gur dhvpx oebja sbk.']), ('anagranny', ['listen']),
+            ('styler', []), ('animate_matcher', []), ('echo', []),
+            ('pager', ['README.md'])]
+games = set('2048 glutton snake sokoban satgame tictactoe typingspeed cryptogram'.split())
+target_ms = 50
+
+def time_to_first_output(argv, rows=40, cols=100, timeout=10):
+    """Run argv on a new pty; return (seconds until it wrote anything,
+    what it wrote first), or (None, '') if it wrote nothing in time."""
+    master, slave = os.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('hhhh', rows, cols, 0, 0))
+    start = time.time()
+    child = subprocess.Popen(argv, stdin=slave, stdout=slave, stderr=slave, cwd=here)
+    try:
+        if not select.select([master], [], [], timeout)[0]:
+            return None, ''
+        elapsed = time.time() - start
+        output = os.read(master, 4096)
+        while b'\x1b[' not in output and child.poll() is None: # Is it an error?
+            if not select.select([master], [], [], 1)[0]:
+                break
+            output += os.read(master, 4096)
+        return elapsed, output.decode('utf-8', 'replace')
+    finally:
+        if child.poll() is None:
+            os.kill(child.pid, signal.SIGKILL)
+        child.wait()
+        os.close(master)
+        os.close(slave)
+
+def time_to_exit(argv):
+    start = time.time()
+    subprocess.check_call(argv, cwd=here)
+    return time.time() - start
+
+def first_frame_ms(name, args, repeats):
+    "Return the best time to first frame in ms, or an explanation of failure."
+    best = None
+    for _ in range(repeats):
+        elapsed, output = time_to_first_output([sys.executable, name + '.py'] + args)
+        if elapsed is None:
+            return 'no output'
+        if '\x1b[' not in output:         # (A traceback or usage message.)
+            return 'failed: ' + output.strip().splitlines()[-1][:50]
+        best = elapsed if best is None else min(best, elapsed)
+    return 1000 * best
+
+def main(argv):
+    args = argv[1:]
+    repeats = 5
+    if args[:1] == ['-n'] and 1 < len(args):
+        repeats, args = int(args[1]), args[2:]
+    if any(arg.startswith('-') for arg in args):
+        print(__doc__)
+        return 2
+    chosen = [(name, pargs) for name, pargs in programs if not args or name in args]
+
+    print('%-16s %9s' % ('startup', 'ms'))
+    for label, code in (('python', 'pass'), ('import sturm', 'import sturm')):
+        ms = 1000 * min(time_to_exit([sys.executable, '-c', code]) for _ in range(repeats))
+        print('%-16s %9.1f' % (label, ms))
+    print('%-16s %9s' % ('first frame', 'ms'))
+    for name, pargs in chosen:
+        ms = first_frame_ms(name, pargs, repeats)
+        if not isinstance(ms, float):
+            print('%-16s %s' % (name, ms))
+        else:
+            over = '  (over %d ms)' % target_ms if name in games and target_ms < ms else ''
+            print('%-16s %9.1f%s' % (name, ms, over))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,200 @@
+"""
+Time sturm's rendering and key decoding on workloads like the examples'.
+
+Usage: python -m bench.suite [-n REPEATS] [--save FILE] [--compare FILE]
+
+Each benchmark runs against a sturm.Headless terminal, so there's no
+tty or clock in the way. It reports units (frames, pages, or keys)
+per second, bytes sent per unit (for keys, bytes read), and, where
+tracemalloc is available, the KB allocated at peak during a unit.
+
+--save writes the results as JSON. --compare reads such a file and
+reports each number that got more than 10% worse; then the exit
+status is 1.
+"""
+
+import random, sys, time
+
+import sturm
+from bench import common
+
+try:
+    import tracemalloc
+except ImportError:             # (Python 2)
+    tracemalloc = None
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# A benchmark is a function taking a Headless terminal and returning
+# (unit, steps): steps is a list of functions, each doing one unit of work.
+benchmarks, benchmark = common.registry()
+
+@benchmark
+def glutton(terminal):
+    import glutton
+    sturm.repainting = 'cells'  # As glutton.main() sets.
+    random.seed(42)
+    grid = [list(line) for line in glutton.maze]
+    ghosts = [glutton.make_ghost(grid) for _ in range(4)]
+    def step(positions):
+        for ghost, p in zip(ghosts, positions):
+            ghost.p = p
+        sturm.render(glutton.view(grid, ghosts, False))
+    steps = []
+    for _ in range(300):
+        for ghost in ghosts:
+            ghost.act(grid)
+        positions = [ghost.p for ghost in ghosts]
+        steps.append(lambda positions=positions: step(positions))
+    return 'frame', steps
+
+@benchmark
+def board_2048(terminal):
+    game = __import__('2048')   # (Not a valid identifier.)
+    random.seed(42)
+    boards = []
+    board = game.make_board()
+    while len(boards) < 300:
+        moves = [slides for slides in (list(arrow(board)) for arrow in game.arrows.values())
+                 if slides]
+        if not moves:
+            board = game.make_board()
+            continue
+        slides = random.choice(moves)
+        boards.extend(slides)
+        board = game.plop(slides[-1], 2 if random.random() < .9 else 4)
+    return 'frame', [lambda board=board: sturm.render(game.heading, game.view(board), '')
+                     for board in boards]
+
+@benchmark
+def satgame(terminal):
+    import satgame
+    rng = random.Random(42)
+    nvariables = 30
+    problem = [[rng.choice((-1, 1)) * v for v in rng.sample(range(1, nvariables+1), 3)]
+               for _ in range(100)]
+    game = satgame.Game(problem)
+    def step(v):
+        game.flip(v)
+        sturm.render(satgame.instructions, "\n\n",
+                     game.view(), "\n",
+                     "You win!" if game.is_solved() else "")
+    return 'frame', [lambda v=rng.randint(1, nvariables): step(v)
+                     for _ in range(200)]
+
+@benchmark
+def pager(terminal):
+    import pager
+    rng = random.Random(42)
+    words = 'the quick brown fox\tjumps over lazy dogs'.split(' ')
+    lines = [' '.join(rng.choice(words) for _ in range(rng.randint(0, 14)))
+             for _ in range(terminal.rows - 1)]
+    text = u'\n'.join(lines) + u'\n'
+    def step():
+        pager.row, pager.col = 0, 0
+        pager.page(StringIO(text))
+    terminal.feed(*[' '] * 100)     # To answer each --more--.
+    return 'page', [step] * 100
+
+@benchmark
+def keys(terminal):
+    rng = random.Random(42)
+    sequences = [keys for keys in sturm.key_map
+                 if keys not in (sturm.esc, sturm.paste_start)]
+    plain = [chr(c) for c in range(32, 127)] + ['\t', '\n', sturm.ctrl('a')]
+    stream = ''.join(rng.choice(sequences if rng.random() < .5 else plain)
+                     for _ in range(100000))
+    terminal.feed(*[stream[i:i+4096] for i in range(0, len(stream), 4096)])
+    return 'key', [sturm.get_key] * 100000
+
+def measure(bench, repeats):
+    "Return a dict of results from running bench."
+    best = None
+    for _ in range(repeats):
+        terminal, unit, steps = set_up(bench)
+        with sturm.cbreak_mode():
+            start = time.time()
+            for step in steps:
+                step()
+            elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    nbytes = terminal.bytes_read if unit == 'key' else terminal.bytes_written
+    return dict(unit=unit,
+                per_sec=len(steps) / best,
+                bytes_per=float(nbytes) / len(steps),
+                alloc_kb_per=measure_allocation(bench))
+
+def measure_allocation(bench):
+    "Return the mean peak KB allocated during a step, or None if we can't tell."
+    if tracemalloc is None or not hasattr(tracemalloc, 'reset_peak'):
+        return None
+    terminal, unit, steps = set_up(bench)
+    total = 0
+    with sturm.cbreak_mode():
+        tracemalloc.start()
+        try:
+            for step in steps:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                step()
+                total += tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+    return total / 1024. / len(steps)
+
+def set_up(bench):
+    sturm.repainting = 'lines'
+    sturm.backend = terminal = sturm.Headless(rows=50, cols=120)
+    unit, steps = bench(terminal)
+    return terminal, unit, steps
+
+# Which way is worse, for each number we compare.
+worse = dict(per_sec=-1, bytes_per=+1, alloc_kb_per=+1)
+tolerance = 0.10
+
+def compare(results, baseline):
+    "Print the regressions from baseline; return true if there were any."
+    regressed = False
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for key, sign in sorted(worse.items()):
+            if result.get(key) is None or not old.get(key):
+                continue
+            change = (result[key] - old[key]) / float(old[key])
+            if tolerance < sign * change:
+                print('%-12s %-13s %10.1f -> %10.1f  (%+.0f%%)'
+                      % (name, key, old[key], result[key], 100 * change))
+                regressed = True
+    return regressed
+
+def main(argv):
+    flags = common.parse_flags(__doc__, argv, {'-n': 5, '--save': None, '--compare': None})
+    if flags is None:
+        return 2
+
+    backend = sturm.backend
+    results = {}
+    try:
+        for bench in benchmarks:
+            results[bench.__name__] = measure(bench, flags['-n'])
+    finally:
+        sturm.backend, sturm.repainting = backend, 'lines'
+
+    common.report(benchmarks, results, [('bytes/unit', 'bytes_per'),
+                                        ('alloc KB/unit', 'alloc_kb_per')])
+    if flags['--save']:
+        common.save(flags['--save'], results)
+    against = flags['--compare']
+    if against:
+        if compare(results, common.load(against)):
+            return 1
+        print('No regressions against %s.' % against)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
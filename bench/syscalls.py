@@ -0,0 +1,79 @@
+"""
+Count the output calls sturm.render makes per frame of glutton.py.
+
+Usage: python -m bench.syscalls [nframes]
+
+Output goes to /dev/null. To compare against an older sturm, run this
+with that sturm.py first on PYTHONPATH.
+"""
+
+import os, random, sys, time
+
+import sturm
+import glutton
+
+class Counter(object):
+    """Stands in for sys.stdout on a tty: counts calls, and like a
+    line-buffered stream sends text to /dev/null at each newline or flush."""
+    def __init__(self, fd):
+        self.fd = fd
+        self.encoding = 'utf-8'
+        self.buffer = []
+        self.writes = self.flushes = 0
+    def fileno(self):
+        return self.fd
+    def write(self, s):
+        self.writes += 1
+        self.buffer.append(s)
+        if '\n' in s:
+            self.send()
+    def flush(self):
+        self.flushes += 1
+        self.send()
+    def send(self):
+        if self.buffer:
+            s = ''.join(self.buffer)
+            os.write(self.fd, s if isinstance(s, bytes) else s.encode('utf-8'))
+            self.buffer = []
+
+def main(argv):
+    nframes = int(argv[1]) if len(argv) > 1 else 200
+    random.seed(42)
+    grid = [list(line) for line in glutton.maze]
+    ghosts = [glutton.make_ghost(grid) for _ in range(4)]
+    scenes = []
+    for _ in range(nframes):
+        for ghost in ghosts:
+            ghost.act(grid)
+        scenes.append([ghost.p for ghost in ghosts])
+
+    sturm.ROWS, sturm.COLS = 40, 80   # Big enough for the maze.
+    fd = os.open(os.devnull, os.O_WRONLY)
+    counter = Counter(fd)
+    syscalls = [0]
+    real_write = os.write
+    def counting_write(fd, data):
+        syscalls[0] += 1
+        return real_write(fd, data)
+
+    stdout, sys.stdout, os.write = sys.stdout, counter, counting_write
+    try:
+        start = time.time()
+        for positions in scenes:
+            for ghost, p in zip(ghosts, positions):
+                ghost.p = p
+            sturm.render(glutton.view(grid, ghosts, False))
+        elapsed = time.time() - start
+    finally:
+        sys.stdout, os.write = stdout, real_write
+        os.close(fd)
+
+    print('%d frames, %.2f ms/frame' % (nframes, 1000 * elapsed / nframes))
+    print('per frame: %.1f stdout.write calls, %.1f flushes, %.1f write syscalls'
+          % (float(counter.writes) / nframes,
+             float(counter.flushes) / nframes,
+             float(syscalls[0]) / nframes))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
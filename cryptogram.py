@@ -2,7 +2,7 @@
 A UI for cryptogram puzzles.
 """
 
-import collections, commands, itertools, random, string, sys
+import collections, itertools, random, string, subprocess, sys
 import sturm
 from sturm import ctrl
 
@@ -12,6 +12,7 @@ def main(argv):
     else:
         print("Usage: python %s [cryptogram]" % sys.argv[0])
         sys.exit(1)
+    sturm.bracketed_paste = True
     with sturm.cbreak_mode():
         puzzle(cryptogram)
 
@@ -31,8 +32,10 @@ def fortune():
             return text
 
 def shell_run(command):
-    err, output = commands.getstatusoutput(command)
-    if err:
+    process = subprocess.Popen(command, shell=True, universal_newlines=True,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0].rstrip('\n')
+    if process.returncode:
         print(output)
         sys.exit(1)
     return output
@@ -41,9 +44,10 @@ def puzzle(cryptogram):
     def my(): pass        # A hack to get a mutable-nonlocal variable.
     my.cursor = 0         # TODO: simpler now to track line# and column#?
     cryptogram = cryptogram.upper()
-    lines = map(clean, cryptogram.splitlines())
-    code_lines = filter(None, [''.join(c for c in line if c.isalpha())
-                               for line in lines])
+    lines = [clean(line) for line in cryptogram.splitlines()]
+    code_lines = [code_line for code_line in (''.join(c for c in line if c.isalpha())
+                                              for line in lines)
+                  if code_line]
     line_starts = running_sum(map(len, code_lines))
     code = ''.join(code_lines)
     assert code
@@ -95,10 +99,9 @@ def puzzle(cryptogram):
                 yield color(c)
             yield '\n'
 
-    while True:
-        sturm.render(view())
-        key = sturm.get_key()
-        if   key == ctrl('X'): break
+    def act(key):
+        "Respond to a key; return false to quit."
+        if   key == ctrl('X'): return False
         elif key == 'home':    my.cursor = 0
         elif key == 'end':     my.cursor = len(code)-1
         elif key == 'left':    shift_by(-1)
@@ -118,10 +121,27 @@ def puzzle(cryptogram):
             shift_by(1)
         elif key.isupper() and len(key) == 1:
             shift_to_code(1, key)
+        return True
+
+    # Apply all the keys typed so far before rendering again, so a
+    # paste or a burst of typing costs one frame.
+    while True:
+        sturm.render(view())
+        if not all(act(key) for key in expand_pastes(sturm.get_keys())):
+            break
 
     # So the shell prompt after exit doesn't overwrite the middle:
     sturm.render(view(show_cursor=False))
 
+def expand_pastes(keys):
+    "Treat pasted text like its letters typed in lowercase."
+    for key in keys:
+        if key[0] == 'paste':
+            for c in key[1].lower():
+                yield c
+        else:
+            yield key
+
 def clean(s):
     "Expand tabs; blank out other control characters."
     r = ''
@@ -9,6 +9,7 @@ import textwrap
 import sturm
 
 def main():
+    sturm.max_fps = 30          # Don't fall behind when a key auto-repeats.
     with sturm.cbreak_mode():
         run()
 
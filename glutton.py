@@ -9,6 +9,8 @@ with open('glutton.maze') as f:
     maze = f.read().splitlines()[1:]
 
 def main():
+    sturm.repainting = 'cells'  # Only a few characters change per tick.
+    sturm.threaded_output = True # Keep ticking steadily over a slow link.
     with sturm.cbreak_mode():
         run()
 
@@ -99,8 +101,8 @@ class Agent(object):
         self.meal = None
         self.move(grid, self.heading) or self.move(grid, self.v)
 
-    def move(self, grid, (dx, dy)):
-        x, y = self.p
+    def move(self, grid, v):
+        (dx, dy), (x, y) = v, self.p
         x2, y2 = (x+dx) % len(grid[0]), (y+dy) % len(grid)
         if grid[y2][x2] in ' .o<>V^':
             self.step(grid, x2, y2)
@@ -0,0 +1,298 @@
+"""
+A CDCL SAT solver: conflict-driven clause learning, with two watched
+literals per clause, VSIDS branching with phase saving, Luby restarts,
+and periodic deletion of the learned clauses that look least useful.
+
+Problems and envs are as in sat.py.
+
+Inside, a literal is coded as an index: 2*v for variable v, 2*v+1 for
+its complement, so flipping the low bit negates it.
+"""
+
+import heapq, itertools
+
+from .sat import problem_variables
+
+def solve(problem):
+    """Return an env satisfying problem, giving a value to each of its
+    variables, or None if it's unsatisfiable."""
+    return Solver(problem).solve()
+
+## solve([[1, 2], [-1, 2], [-2, 3]])
+#. {1: False, 2: True, 3: True}
+## solve([[1], [-1, 2], [-2]])
+
+def encode(literal):
+    return 2*literal if 0 < literal else 1 - 2*literal
+
+def decode(code):
+    return -(code >> 1) if code & 1 else code >> 1
+
+class Solver(object):
+
+    restart_unit  = 100         # Conflicts per unit of the Luby sequence.
+    reduce_first  = 2000        # Conflicts before the first learned-clause deletion,
+    reduce_growth = 300         # and how much longer each interval after gets.
+    var_decay     = 0.95
+
+    def __init__(self, problem):
+        self.variables = problem_variables(problem)
+        n = self.variables[-1] if self.variables else 0
+        self.values   = [0] * (2*n + 2) # Per literal: 1 true, -1 false, 0 unassigned.
+        self.level    = [0] * (n + 1)   # Per variable: the decision level it was set at,
+        self.reason   = [None] * (n + 1) # and the clause that implied it, if any.
+        self.phase    = [2*v + 1 for v in range(n + 1)] # The literal to decide on.
+        self.activity = [0.0] * (n + 1)
+        self.var_inc  = 1.0
+        self.seen     = [False] * (n + 1)
+        self.watches  = [[] for _ in range(2*n + 2)] # Per literal: clauses watching it.
+        self.trail    = []      # The literals made true, in order,
+        self.trail_lim = []     # and where each decision level starts in it.
+        self.qhead    = 0       # How much of the trail has been propagated.
+        self.learned  = []      # Of (lbd, clause).
+        self.conflicts = 0
+        self.heap = [(0.0, v) for v in self.variables] # Of (-activity, variable).
+        self.ok = all(self.add_clause(clause) for clause in problem)
+
+    def add_clause(self, clause):
+        "Add a clause of the problem; return false if that makes it unsatisfiable."
+        codes = set()
+        for literal in clause:
+            code = encode(literal)
+            if code ^ 1 in codes or self.values[code] == 1:
+                return True     # (Always satisfied.)
+            if self.values[code] == 0:
+                codes.add(code)
+        codes = list(codes)
+        if not codes:
+            return False
+        if len(codes) == 1:
+            self.assign(codes[0], None)
+            return self.propagate() is None
+        self.watch(codes)
+        return True
+
+    def watch(self, clause):
+        self.watches[clause[0]].append(clause)
+        self.watches[clause[1]].append(clause)
+
+    def assign(self, code, reason):
+        values = self.values
+        values[code], values[code ^ 1] = 1, -1
+        v = code >> 1
+        self.level[v] = len(self.trail_lim)
+        self.reason[v] = reason
+        self.trail.append(code)
+
+    def propagate(self):
+        """Make every unit clause's remaining literal true, till none is
+        left; return a clause made false along the way, or None."""
+        values, watches, trail = self.values, self.watches, self.trail
+        level, reason = self.level, self.reason
+        depth = len(self.trail_lim)
+        while self.qhead < len(trail):
+            false_code = trail[self.qhead] ^ 1
+            self.qhead += 1
+            ws = watches[false_code]
+            i = j = 0
+            n = len(ws)
+            while i < n:
+                clause = ws[i]
+                i += 1
+                # Keep the literal that just went false at clause[1].
+                if clause[0] == false_code:
+                    clause[0], clause[1] = clause[1], false_code
+                first = clause[0]
+                if values[first] == 1:
+                    ws[j] = clause
+                    j += 1
+                    continue
+                # Look for another literal to watch in its place.
+                for k in range(2, len(clause)):
+                    code = clause[k]
+                    if values[code] != -1:
+                        clause[1], clause[k] = code, false_code
+                        watches[code].append(clause)
+                        break
+                else:
+                    ws[j] = clause
+                    j += 1
+                    if values[first] == -1:
+                        ws[j:i] = []    # (Keeping the unvisited ones.)
+                        self.qhead = len(trail)
+                        return clause
+                    values[first], values[first ^ 1] = 1, -1
+                    v = first >> 1
+                    level[v] = depth
+                    reason[v] = clause
+                    trail.append(first)
+            del ws[j:]
+        return None
+
+    def analyze(self, conflict):
+        """Return a clause learned from conflict, asserting its first
+        literal at the level to backjump to, which we also return."""
+        seen, level, reason, trail = self.seen, self.level, self.reason, self.trail
+        depth = len(self.trail_lim)
+        learned = [None]        # (The asserting literal goes here.)
+        pending = 0             # Seen literals of this level not yet resolved away.
+        index = len(trail) - 1
+        clause, code = conflict, None
+        while True:
+            for other in (clause if code is None else clause[1:]):
+                v = other >> 1
+                if not seen[v] and level[v] > 0:
+                    seen[v] = True
+                    self.bump(v)
+                    if level[v] == depth: pending += 1
+                    else:                 learned.append(other)
+            while not seen[trail[index] >> 1]:
+                index -= 1
+            code = trail[index]
+            index -= 1
+            v = code >> 1
+            seen[v] = False
+            pending -= 1
+            if pending == 0:
+                break
+            clause = reason[v]
+        learned[0] = code ^ 1
+        # Drop literals implied by the others (which are still seen).
+        kept = [learned[0]] + [other for other in learned[1:] if not self.redundant(other)]
+        for other in learned[1:]:
+            seen[other >> 1] = False
+        if len(kept) == 1:
+            return kept, 0
+        # Watch the literal of the highest level below, so it's the
+        # first to come unassigned.
+        i = max(range(1, len(kept)), key=lambda i: level[kept[i] >> 1])
+        kept[1], kept[i] = kept[i], kept[1]
+        return kept, level[kept[1] >> 1]
+
+    def redundant(self, code):
+        clause = self.reason[code >> 1]
+        return clause is not None and all(self.seen[other >> 1] or self.level[other >> 1] == 0
+                                          for other in clause[1:])
+
+    def bump(self, v):
+        activity = self.activity
+        activity[v] += self.var_inc
+        if 1e100 < activity[v]:
+            for u in self.variables:
+                activity[u] *= 1e-100
+            self.var_inc *= 1e-100
+            self.heap = [(-activity[u], u) for u in self.variables if self.values[2*u] == 0]
+            heapq.heapify(self.heap)
+        elif self.values[2*v] == 0:
+            heapq.heappush(self.heap, (-activity[v], v))
+
+    def cancel_until(self, depth):
+        "Undo the assignments above decision level depth."
+        if depth < len(self.trail_lim):
+            values, reason, phase, activity = self.values, self.reason, self.phase, self.activity
+            heap = self.heap
+            start = self.trail_lim[depth]
+            for code in self.trail[start:]:
+                values[code] = values[code ^ 1] = 0
+                v = code >> 1
+                reason[v] = None
+                phase[v] = code
+                heapq.heappush(heap, (-activity[v], v))
+            del self.trail[start:]
+            del self.trail_lim[depth:]
+            self.qhead = start
+            if 4 * len(self.variables) < len(heap):
+                self.heap = [(-activity[v], v) for v in set(v for _, v in heap)
+                             if values[2*v] == 0]
+                heapq.heapify(self.heap)
+
+    def pick_branch(self):
+        "Return the literal to decide on next, or None if all are assigned."
+        heap, values, activity = self.heap, self.values, self.activity
+        while heap:
+            key, v = heapq.heappop(heap)
+            # (Skip assigned variables, and stale entries: a variable's
+            # current activity always has an entry while it's unassigned.)
+            if values[2*v] == 0 and -key == activity[v]:
+                return self.phase[v]
+        return None
+
+    def reduce_learned(self):
+        """Delete the less useful half of the learned clauses, by their
+        LBD (how many decision levels they spanned when learned)."""
+        self.learned.sort(key=lambda entry: entry[0])
+        half = len(self.learned) // 2
+        keep, drop = self.learned[:half], []
+        for entry in self.learned[half:]:
+            lbd, clause = entry
+            if lbd <= 2 or self.reason[clause[0] >> 1] is clause:
+                keep.append(entry)
+            else:
+                drop.append(clause)
+        if drop:
+            dead = set(map(id, drop))
+            for ws in self.watches:
+                ws[:] = [clause for clause in ws if id(clause) not in dead]
+        self.learned = keep
+
+    def search(self, budget):
+        """Search for up to budget conflicts; return True if satisfied,
+        False if unsatisfiable, or None to restart."""
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                budget -= 1
+                if not self.trail_lim:
+                    return False
+                learned, depth = self.analyze(conflict)
+                self.cancel_until(depth)
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.watch(learned)
+                    lbd = len(set(self.level[code >> 1] for code in learned))
+                    self.learned.append((lbd, learned))
+                    self.assign(learned[0], learned)
+                self.var_inc /= self.var_decay
+            else:
+                if budget <= 0:
+                    return None
+                if self.next_reduce <= self.conflicts:
+                    self.reduce_learned()
+                    self.reductions += 1
+                    self.next_reduce = self.conflicts + self.reduce_first + self.reduce_growth * self.reductions
+                code = self.pick_branch()
+                if code is None:
+                    return True
+                self.trail_lim.append(len(self.trail))
+                self.assign(code, None)
+
+    def solve(self):
+        "Return an env satisfying the problem, or None if it's unsatisfiable."
+        if not self.ok:
+            return None
+        self.reductions = 0
+        self.next_reduce = self.reduce_first
+        for i in itertools.count(1):
+            result = self.search(luby(i) * self.restart_unit)
+            if result is False:
+                return None
+            if result:
+                return {v: self.values[2*v] == 1 for v in self.variables}
+            self.cancel_until(0)
+
+def luby(i):
+    "Return the ith number (from 1) of the Luby sequence 1 1 2 1 1 2 4 1 1 2 ..."
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while (1 << k) - 1 != i:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+## [luby(i) for i in range(1, 16)]
+#. [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]
@@ -0,0 +1,111 @@
+"""
+A compact SAT problem: the literals of all the clauses in one flat
+array, each clause ending with a 0 as in a DIMACS file, with another
+array of where each clause starts. It acts like
+the list of lists in sat.py -- you can take its len, index it, and
+iterate over its clauses -- so the same code checks, solves or shows
+either one. Each clause comes out as a view into the shared array
+rather than a copy (except on Python 2, whose arrays can't be viewed).
+
+Indexes of where each literal occurs, and of the variables, get built
+once, on first use.
+"""
+
+from array import array
+
+try:
+    memoryview(array('i'))
+    view = memoryview
+except TypeError:
+    view = lambda literals: literals # (Slicing this makes a copy.)
+
+class CNF(object):
+
+    def __init__(self, clauses=(), literals=None, starts=None, nvariables=None):
+        """Make a problem of clauses; or, from a parser, make one of
+        arrays already built: literals, and starts with the offset of
+        each clause in literals, and then len(literals). If you know
+        nvariables, at least the highest variable, pass it to save
+        scanning the literals for it."""
+        if literals is None:
+            literals, starts = array('i'), array('l', [0])
+            for clause in clauses:
+                literals.extend(clause)
+                literals.append(0)
+                starts.append(len(literals))
+        if nvariables is None:
+            nvariables = max(max(literals), -min(literals)) if literals else 0
+        self.literals = literals
+        self.starts   = starts
+        self.nvariables = nvariables
+        self.view     = view(literals)
+        self.counts   = None    # Per variable, how many times it occurs.
+        self.occurs   = None    # Clause indexes by literal, in blocks,
+        self.occurs_starts = None # and where each literal's block starts.
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("clause index out of range")
+        return self.view[self.starts[i]:self.starts[i+1]-1]
+
+    def __iter__(self):
+        lits, starts = self.view, self.starts
+        for i in range(len(starts) - 1):
+            yield lits[starts[i]:starts[i+1]-1]
+
+    def __repr__(self):
+        return 'CNF(%r)' % [list(clause) for clause in self]
+
+    def build_index(self):
+        n = self.nvariables
+        # Count each literal (offset by n to index from 0), then lay
+        # out one block per literal, then fill the blocks in.
+        counts = array('l', [0]) * (2*n + 2)
+        for literal in self.literals:
+            counts[literal + n] += 1
+        counts[n] = 0           # (The 0s that end clauses.)
+        occurs_starts = array('l', [0]) * (2*n + 2)
+        total = 0
+        for i, count in enumerate(counts):
+            occurs_starts[i] = total
+            total += count
+        fill = array('l', occurs_starts)
+        occurs = array('l', [0]) * total
+        lits, starts = self.literals, self.starts
+        for c in range(len(self)):
+            for k in range(starts[c], starts[c+1] - 1):
+                slot = lits[k] + n
+                occurs[fill[slot]] = c
+                fill[slot] += 1
+        self.counts = array('l', [counts[n + v] + counts[n - v] for v in range(n + 1)])
+        self.counts[0] = 0
+        self.occurs, self.occurs_starts = view(occurs), occurs_starts
+
+    def occurrences(self, literal):
+        "Return the indexes of the clauses literal occurs in, in order."
+        if self.occurs is None:
+            self.build_index()
+        slot = literal + self.nvariables
+        if literal == 0 or not 0 <= slot <= 2*self.nvariables:
+            return ()
+        return self.occurs[self.occurs_starts[slot]:self.occurs_starts[slot+1]]
+
+    def count(self, variable):
+        "Return how many times variable occurs, either way."
+        if self.counts is None:
+            self.build_index()
+        return self.counts[variable] if 0 < variable <= self.nvariables else 0
+
+    def variables(self):
+        "Return the variables that occur, in order."
+        if self.counts is None:
+            self.build_index()
+        return [v for v, count in enumerate(self.counts) if count]
+
+## problem = CNF([[1, -2], [2, 3], [-3]])
+## len(problem), list(problem[1]), list(problem.occurrences(-3)), problem.variables()
+#. (3, [2, 3], [2], [1, 2, 3])
@@ -1,48 +1,298 @@
 """
 Read or write the DIMACS CNF file format.
+
+load() reads a file a line at a time into lists, which does for small
+ones. load_cnf() reads big files quickly: it memory-maps the file and
+turns each block of it into numbers at a go, into a compact cnf.CNF.
+It can also keep a binary copy of what it read next to the file, to
+reload instantly. clauses() streams them one at a time instead.
+
+save() writes in one pass, in big chunks, from any iterable of clauses
+(even a generator), gzipped for a filename ending in .gz.
 """
 
-def save(filename, problem):
-    save_file(open(filename, 'w'), problem)
+from array import array
+from itertools import chain, compress, count
+from operator import not_
+import io, mmap, os, re, tempfile
+
+from .cnf import CNF
+
+block_size = 1 << 22
+gzip_level = 6                  # (zlib's default: nearly 9's size, and faster.)
+
+def save(filename, problem, nvariables=None, nclauses=None):
+    "Write problem to a file, gzipped if its name ends in .gz."
+    if filename.endswith('.gz'):
+        import gzip
+        # (A gzip file says it can seek, but not back to the header.)
+        with gzip.open(filename, 'wb', compresslevel=gzip_level) as f:
+            save_file(f, problem, nvariables, nclauses, seekable=False)
+    else:
+        with open(filename, 'wb') as f:
+            save_file(f, problem, nvariables, nclauses)
+
+def save_file(f, problem, nvariables=None, nclauses=None, seekable=None):
+    """Write problem to f in one pass. It can be any iterable of
+    clauses, like a generator. For the counts in the header we don't
+    get told or can't tell from problem up front, we leave room at the
+    start and fill them in at the end; or, if f can't seek, write the
+    clauses to a temporary file first."""
+    if nclauses is None and hasattr(problem, '__len__'):
+        nclauses = len(problem)
+    if nvariables is None and isinstance(problem, CNF):
+        nvariables = problem.nvariables
+    binary = not isinstance(f, io.TextIOBase)
+    if nvariables is not None and nclauses is not None:
+        write_text(f, binary, header_line(nvariables, nclauses))
+        counts = write_clauses(f, binary, problem, False)
+    elif seekable if seekable is not None else is_seekable(f):
+        start = f.tell()
+        write_text(f, binary, 'c'.ljust(header_width) + '\n')
+        counts = write_clauses(f, binary, problem, nvariables is None)
+        f.seek(start)
+        write_text(f, binary, header_line(nvariables or counts[0], nclauses or counts[1],
+                                          header_width))
+        f.seek(0, 2)
+    else:
+        with tempfile.TemporaryFile() as spool:
+            counts = write_clauses(spool, True, problem, nvariables is None)
+            write_text(f, binary, header_line(nvariables or counts[0], nclauses or counts[1]))
+            spool.seek(0)
+            for block in iter(lambda: spool.read(block_size), b''):
+                f.write(block if binary else block.decode('ascii'))
+    if nclauses is not None and nclauses != counts[1]:
+        raise Exception('Expected %d clauses, wrote %d' % (nclauses, counts[1]))
+
+header_width = len(' '.join(['p cnf', str(2**63), str(2**63)]))
+
+def header_line(nvariables, nclauses, width=0):
+    "Return the header, padded with spaces to width before its newline."
+    return ('p cnf %d %d' % (nvariables, nclauses)).ljust(width) + '\n'
 
-def save_file(f, problem):
-    nvariables = reduce(max,
-                        (abs(literal) for clause in problem for literal in clause),
-                        0)
-    nclauses = len(problem)
-    print >>f, 'p cnf', nvariables, nclauses
-    for clause in problem:
-        for literal in clause:
-            print >>f, literal,
-        print >>f, 0
+def write_clauses(f, binary, clauses, find_nvariables, batch_size=8192):
+    """Write clauses to f, a batch at a time; return (the highest
+    variable if find_nvariables else 0, how many clauses)."""
+    nvariables = nclauses = 0
+    batch = []
+    for clause in clauses:
+        batch.append(clause)
+        if len(batch) == batch_size:
+            nvariables = write_batch(f, binary, batch, find_nvariables, nvariables)
+            nclauses += len(batch)
+            batch = []
+    if batch:
+        nvariables = write_batch(f, binary, batch, find_nvariables, nvariables)
+        nclauses += len(batch)
+    return nvariables, nclauses
+
+def write_batch(f, binary, batch, find_nvariables, nvariables):
+    lines = [' '.join(map(str, clause)) for clause in batch]
+    write_text(f, binary, ' 0\n'.join(lines) + ' 0\n')
+    if find_nvariables:
+        literals = list(chain.from_iterable(batch))
+        if literals:
+            nvariables = max(nvariables, max(literals), -min(literals))
+    return nvariables
+
+def write_text(f, binary, text):
+    f.write(text.encode('ascii') if binary else text)
+
+def is_seekable(f):
+    try:
+        f.tell()
+        return f.seekable() if hasattr(f, 'seekable') else True
+    except (IOError, OSError):
+        return False
 
 def load(filename):
-    return load_file(open(filename))
+    """Return (nvariables, clauses) from a file, with clauses as lists.
+    For a big file, load_cnf() is quicker and takes less memory."""
+    with open(filename) as f:
+        return load_file(f)
 
 def load_file(f):
-    nvariables = None
-    nclauses = None
+    "Like load(), from a file open as text, read a line at a time."
+    header = []
     clauses = []
     clause = []
     for line in f:
-        if line.startswith('c'):
+        first = line[:1]
+        if first in 'cp%':
+            if first == 'c':
+                continue
+            if first == '%':    # (SATLIB's files end with a % line.)
+                break
+            fields = line.split()
+            if fields[:2] != ['p', 'cnf'] or len(fields) != 4:
+                raise Exception('Not in DIMACS CNF format')
+            header[:] = [int(fields[2]), int(fields[3])]
+            n = header[0]
             continue
-        if line.startswith('p'):
-            f1, f2, f3, f4 = line.split()
-            if f1 != 'p' or f2 != 'cnf':
+        if not header:
+            if line.strip():
                 raise Exception('Not in DIMACS CNF format')
-            nvariables = int(f3)
-            nclauses = int(f4)
-        else:
-            lits = map(int, line.split())
-            for lit in lits:
-                if lit == 0:
-                    clauses.append(clause)
-                    clause = []
-                else:
-                    assert 1 <= abs(lit) <= nvariables
-                    clause.append(lit)
+            continue
+        for literal in map(int, line.split()):
+            if literal == 0:
+                clauses.append(clause)
+                clause = []
+            elif -n <= literal <= n:
+                clause.append(literal)
+            else:
+                raise Exception('Literal out of range')
     if clause:
         clauses.append(clause)
-    assert nclauses == len(clauses)
-    return nvariables, clauses
+    check_count(header, len(clauses))
+    return header[0], clauses
+
+def load_cnf(filename, cache=False):
+    """Return (nvariables, problem) from a file, with problem a
+    cnf.CNF. With cache, reuse or else write a binary copy of the
+    result in filename + '.cache'."""
+    if cache:
+        cached = load_cache(filename)
+        if cached is not None:
+            return cached
+    header = []
+    numbers = array('i')
+    with open(filename, 'rb') as f:
+        for block in numbers_in(map_blocks(f), header):
+            numbers.extend(block)
+    if numbers and numbers[-1] != 0:
+        numbers.append(0)
+    starts = array('l', [0])
+    starts.extend(compress(count(1), map(not_, numbers)))
+    check_count(header, len(starts) - 1)
+    result = header[0], CNF(literals=numbers, starts=starts, nvariables=header[0])
+    if cache:
+        save_cache(filename, *result)
+    return result
+
+def clauses(filename):
+    "Generate the clauses in a file, as lists, reading it a block at a time."
+    with open(filename, 'rb') as f:
+        for batch in clause_batches(numbers_in(map_blocks(f), [])):
+            for clause in batch:
+                yield clause
+
+def clause_batches(number_blocks):
+    """Generate lists of the clauses, as lists, in the lists of
+    numbers from numbers_in()."""
+    rest = []                   # The start of a clause left from the last block.
+    for numbers in number_blocks:
+        ends = list(compress(count(), map(not_, numbers)))
+        if not ends:
+            rest.extend(numbers)
+            continue
+        batch = [numbers[start+1:end] for start, end in zip([-1] + ends, ends)]
+        if rest:
+            batch[0] = rest + batch[0]
+        rest = numbers[ends[-1]+1:]
+        yield batch
+    if rest:
+        yield [rest]
+
+def map_blocks(f):
+    "Generate the text of file f in blocks of whole lines, memory-mapped."
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        return
+    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        start = 0
+        while start < size:
+            end = m.find(b'\n', min(start + block_size, size))
+            end = size if end == -1 else end + 1
+            yield m[start:end]
+            start = end
+    finally:
+        m.close()
+
+# A line that's not all numbers: a comment, the header, or an end mark.
+special = re.compile(br'^[ \t]*[^-0-9 \t\r\n].*', re.M)
+
+def numbers_in(blocks, header):
+    """Generate a list of the numbers in each block of DIMACS text,
+    with 0 ending each clause. Set header to [nvariables, nclauses]
+    on reaching it."""
+    for block in blocks:
+        if not any(letter in block for letter in (b'c', b'p', b'%')):
+            yield checked(block, header)
+            continue
+        start = 0
+        for m in special.finditer(block):
+            yield checked(block[start:m.start()], header)
+            start = m.end()
+            line = m.group().lstrip()
+            if line[:1] == b'c':
+                continue
+            if line[:1] == b'%':   # (SATLIB's files end with a % line.)
+                return
+            fields = line.split()
+            if fields[:2] != [b'p', b'cnf'] or len(fields) != 4:
+                raise Exception('Not in DIMACS CNF format')
+            header[:] = [int(fields[2]), int(fields[3])]
+        yield checked(block[start:], header)
+
+def checked(text, header):
+    "Return a list of the numbers in text, all in range for header."
+    numbers = list(map(int, text.split()))
+    if numbers:
+        if not header:
+            raise Exception('Not in DIMACS CNF format')
+        if header[0] < max(max(numbers), -min(numbers)):
+            raise Exception('Literal out of range')
+    return numbers
+
+def check_count(header, nclauses):
+    if not header:
+        raise Exception('Not in DIMACS CNF format')
+    if header[1] != nclauses:
+        raise Exception('Expected %d clauses, found %d' % (header[1], nclauses))
+
+def cache_filename(filename):
+    return filename + '.cache'
+
+cache_magic = 'dimacs-cnf-cache-1'
+
+def cache_header(filename, nvariables, problem_nvariables, nliterals, nstarts):
+    "Return the first line of a cache file, which says if it's stale."
+    stat = os.stat(filename)
+    fields = [cache_magic, stat.st_size, repr(stat.st_mtime),
+              nvariables, problem_nvariables, nliterals, nstarts,
+              array('i').itemsize, array('l').itemsize]
+    return ' '.join(map(str, fields)) + '\n'
+
+def save_cache(filename, nvariables, problem):
+    "Save a binary copy of what load_cnf() read from filename."
+    header = cache_header(filename, nvariables, problem.nvariables,
+                          len(problem.literals), len(problem.starts))
+    temp = cache_filename(filename) + '.%d' % os.getpid()
+    with open(temp, 'wb') as f:
+        f.write(header.encode('ascii'))
+        problem.literals.tofile(f)
+        problem.starts.tofile(f)
+    os.rename(temp, cache_filename(filename))
+
+def load_cache(filename):
+    "Return (nvariables, problem) as saved for filename, or None if stale."
+    try:
+        f = open(cache_filename(filename), 'rb')
+    except IOError:
+        return None
+    with f:
+        header = f.readline().decode('ascii', 'replace')
+        fields = header.split()
+        if len(fields) != 9 or fields[0] != cache_magic:
+            return None
+        nvariables, problem_nvariables, nliterals, nstarts = map(int, fields[3:7])
+        if header != cache_header(filename, nvariables, problem_nvariables, nliterals, nstarts):
+            return None
+        literals, starts = array('i'), array('l')
+        try:
+            literals.fromfile(f, nliterals)
+            starts.fromfile(f, nstarts)
+        except EOFError:
+            return None
+    return nvariables, CNF(literals=literals, starts=starts, nvariables=problem_nvariables)
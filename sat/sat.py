@@ -7,9 +7,15 @@ A literal is a positive or negative integer denoting a variable
 or its complement. Its truth depends on the environment.
 
 An environment is a partial map from positive integer to boolean.
+
+A problem may also be a cnf.CNF, which stores the same thing compactly.
 """
 
+from .cnf import CNF
+
 def problem_variables(problem):
+    if isinstance(problem, CNF):
+        return problem.variables()
     return sorted(set(abs(literal) for clause in problem for literal in clause))
 
 def assign(variable, value, env):
@@ -27,6 +33,14 @@ def seems_consistent(problem, env):
                    for literal in clause)
                for clause in problem)
 
+def solve(problem):
+    "Return an env satisfying problem, or None if there's none."
+    from . import cdcl
+    return cdcl.solve(problem)
+
+## solve([[1, -2], [2, 3], [-3]])
+#. {1: True, 2: True, 3: False}
+
 
 # Constraint constructors
 
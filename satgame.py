@@ -8,6 +8,7 @@ Adapted from https://github.com/darius/sketchbook/blob/master/sat/ttypuzzle.py
 import string
 
 from sat import sat, dimacs
+from sat.cnf import CNF
 import sturm
 
 # Some problems from http://toughsat.appspot.com/
@@ -17,7 +18,7 @@ filenames = ['sat/trivial.dimacs',
              'sat/subsetsum_random.dimacs']
 
 def main():
-    games = [Game(problem) for _,problem in map(dimacs.load, filenames)]
+    games = [Game(problem) for _,problem in map(dimacs.load_cnf, filenames)]
     with sturm.cbreak_mode():
         play(games)
 
@@ -49,6 +50,8 @@ def play(games):
 class Game(object):
 
     def __init__(self, problem):
+        if not isinstance(problem, CNF):
+            problem = CNF(problem)
         variables = sat.problem_variables(problem)
         names = '1234567890' + string.ascii_uppercase
         self.problem   = problem
@@ -57,41 +60,49 @@ class Game(object):
         self.variables = dict(zip(variables, names))
         self.last_flip = None   # The variable last flipped
         self.marked    = {v: False for v in variables}
+        # Per variable, its (clause index, literal) occurrences, with
+        # the negative ones first; per clause, how many of its
+        # literals are true; and how many clauses have none.
+        self.occurrences = {v: [(i, literal)
+                                for literal in (-v, v)
+                                for i in problem.occurrences(literal)]
+                            for v in variables}
+        self.n_true = [sum(1 for literal in clause if literal < 0) for clause in problem]
+        self.n_unsatisfied = self.n_true.count(0)
 
     def variable_of_name(self, name):
         return self.names.get(name.upper())
 
     def is_solved(self):
-        return sat.is_satisfied(self.problem, self.env)
-
-    def clause_is_satisfied(self, clause):
-        return any(self.env.get(abs(literal)) == (0 < literal)
-                   for literal in clause)
+        return self.n_unsatisfied == 0
 
     def flip(self, v):
         self.env[v] ^= True
         self.last_flip = v
+        value, n_true = self.env[v], self.n_true
+        for i, literal in self.occurrences[v]:
+            if (0 < literal) == value:
+                n_true[i] += 1
+                if n_true[i] == 1: self.n_unsatisfied -= 1
+            else:
+                n_true[i] -= 1
+                if n_true[i] == 0: self.n_unsatisfied += 1
 
     def toggle_mark(self):
         if self.last_flip is not None:
             self.marked[self.last_flip] ^= True
 
     def view(self):
-
-        def present(v, clause):
-            pos, neg = v in clause, -v in clause
-            mark = 'O*'[self.env[v] == pos] if pos or neg else '.'
-            color = satisfied if self.clause_is_satisfied(clause) else unsatisfied
-            return color(mark)
-
+        ok = [0 < n for n in self.n_true]
+        blank = [marks['.', clause_ok] for clause_ok in ok]
         for v in self.variables:
             v_color = row_true if self.env[v] else row_false
             if self.marked[v]: v_color = S.compose(S.underlined, v_color)
             name = v_color(self.variables[v])
-            yield name, ' '
-            for clause in self.problem:
-                yield present(v, clause)
-            yield ' ', name, '\n'
+            row = blank[:]
+            for i, literal in self.occurrences[v]:
+                row[i] = marks['O*'[self.env[v] == (0 < literal)], ok[i]]
+            yield name, ' ', row, ' ', name, '\n'
 
 
 S = sturm
@@ -102,6 +113,9 @@ row_false   = S.compose(bg, S.white)
 satisfied   = S.compose(bg, S.blue)
 unsatisfied = S.compose(bg, S.bold, S.yellow)
 
+marks = {(mark, ok): S.compile((satisfied if ok else unsatisfied)(mark))
+         for mark in 'O*.' for ok in (False, True)}
+
 
 if __name__ == '__main__':
     main()
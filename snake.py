@@ -8,6 +8,7 @@ import sturm
 nrows, ncols = 20, 20
  
 def main():
+    sturm.threaded_output = True # Keep ticking steadily over a slow link.
     with sturm.cbreak_mode():
         run()
 
@@ -34,8 +35,8 @@ def run():
     for _ in ticking():
         outcome = ''
         lengthen = False
-        grid = map(list,
-                   ['#'*ncols] + (['#'+(' '*(ncols-2))+'#'] * (nrows-2)) + ['#'*ncols])
+        grid = [list(row) for row in
+                ['#'*ncols] + (['#'+(' '*(ncols-2))+'#'] * (nrows-2)) + ['#'*ncols]]
         grid[target_y][target_x] = '@'
         for x, y in body:
             if grid[y][x] == '@':
@@ -67,8 +68,8 @@ def run():
         if not lengthen: body.pop(0)
         body.append(add(body[-1], heading))
 
-def negate((x, y)):        return (-x, -y)
-def add((x, y), (dx, dy)): return (x+dx, y+dy)
+def negate(v):     return (-v[0], -v[1])
+def add(p, v):     return (p[0]+v[0], p[1]+v[1])
 
 def view(grid, outcome):
     for row in grid:
@@ -25,6 +25,7 @@ import sturm
 
 def main(level_collection, name=''):
     grids = [parse(level) for level in level_collection.split('\n\n')]
+    sturm.max_fps = 30          # Don't fall behind when a key auto-repeats.
     with sturm.cbreak_mode():
         play(grids, name)
 
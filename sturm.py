@@ -2,23 +2,37 @@
 Simple console terminal interaction.
 """
 
-import contextlib, errno, os, select, sys, time
+import codecs, collections, contextlib, errno, fcntl, math, os, re, select, signal, struct, sys, termios, time, tty
+from functools import reduce
+
+# Python 2 and 3 both: a scene's text may be a str (bytes or text) or
+# a Python 2 unicode.
+try:
+    text_types = (str, unicode)
+except NameError:
+    text_types = (str,)
 
 ROWS, COLS = 24, 80
 
 def note_screen_size():
     global ROWS, COLS
-    ROWS, COLS = map(int, os.popen('stty size', 'r').read().split())
+    size = backend.size()
+    if size:
+        ROWS, COLS = size
+
+def on_resize(signum, frame):
+    note_screen_size()
+    invalidate()
 
 # It'd be a little simpler to clear the screen before each repaint,
 # but that causes occasional flicker, so we instead start each repaint
 # with home and then incrementally clear_to_right on each line, and
 # finally clear_to_bottom.
 #
-# OTOH it's still noticeably bad if you repaint many times a second;
-# the next step up in complexity would be to remember, after each
-# frame, a list of the lines showing on the screen, and then only send
-# to the screen the lines that change in the new frame.
+# OTOH it's still noticeably bad if you repaint many times a second,
+# so by default we remember, after each frame, the list of lines
+# showing on the screen, and then send only the lines that change in
+# the new frame, each to its own row. (See `repainting`, below.)
 
 esc = chr(27)
 home            = esc + '[H' # Go to the top left.
@@ -28,26 +42,135 @@ cursor_hide     = esc + '[?25l'
 cursor_show     = esc + '[?25h'
 cursor_save     = esc + '[s'
 cursor_restore  = esc + '[u'
+paste_on        = esc + '[?2004h' # Bracket pasted text in paste_start/end.
+paste_off       = esc + '[?2004l'
+
+# Set this true before entering a mode to get a paste as one key,
+# ('paste', text), instead of a key per character:
+bracketed_paste = False
 
 def raw_mode():    return mode('raw')
 def cbreak_mode(): return mode('cbreak')
 
 @contextlib.contextmanager
 def mode(name):       # 'raw' or 'cbreak'
-    # It looks like this could be done with the tty and termios
-    # modules instead, but at least my code is shorter:
-    # http://stackoverflow.com/questions/1394956/how-to-do-hit-any-key-in-python
+    global depth_in_use
+    saved = backend.enter(name)
     note_screen_size()
-    os.system('stty {} -echo'.format(name))
-    write(home + clear_to_bottom)
+    depth_in_use = None         # (The backend may be new.)
+    if threaded_output:
+        start_writer()
+    pasting = bracketed_paste
+    write((paste_on if pasting else '') + home + clear_to_bottom)
     try:
         yield
     finally:
-        sys.stdout.write(cursor_show + '\n')
-        os.system('stty sane') # XXX save and restore instead
+        render_held()
+        stop_writer()
+        backend.write((paste_off if pasting else '') + cursor_show + '\n')
+        backend.flush()
+        backend.exit(saved)
 
 def write(s):
-    sys.stdout.write(s.replace('\n', newline))
+    global shown
+    shown = None
+    send(s.replace('\n', newline), flush=False, stale=True)
+
+def send(s, flush=True, stale=False):
+    """Output s, in order with any frames before it. If stale, s may
+    change the screen, so the next frame must repaint it all."""
+    if writer_thread is not None:
+        writer_thread.put_text(s, stale)
+    else:
+        backend.write(s)
+        if flush: backend.flush()
+
+
+# The terminal we talk to is the `backend`. Anything with the same
+# methods as Terminal will do; see also Headless, at the end.
+
+class Terminal(object):
+    "The real terminal, on stdin and stdout."
+
+    def __init__(self):
+        self.pending = []       # Output not yet sent.
+        self.depth = None       # How many colors it shows, once we know.
+
+    def fileno(self):
+        "Return the file descriptor to watch for input, or None."
+        return sys.stdin.fileno()
+
+    def size(self):
+        "Return (rows, columns), or None if we can't tell."
+        try:
+            winsize = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, b'\0' * 8)
+        except (AttributeError, ValueError, IOError, OSError):
+            return None         # Not a terminal.
+        rows, cols = struct.unpack('hhhh', winsize)[:2]
+        return (rows, cols) if rows and cols else None
+
+    def enter(self, name):
+        "Enter raw or cbreak mode; return what exit() needs to undo it."
+        fd = sys.stdin.fileno()
+        saved = termios.tcgetattr(fd)
+        old_handler = signal.signal(signal.SIGWINCH, on_resize)
+        if name == 'raw': tty.setraw(fd)    # (Both turn off echo, too.)
+        else:             tty.setcbreak(fd)
+        return saved, old_handler
+
+    def exit(self, saved):
+        attributes, old_handler = saved
+        termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, attributes)
+        signal.signal(signal.SIGWINCH, old_handler)
+
+    def write(self, s):
+        self.pending.append(s)
+
+    def flush(self):
+        "Send the pending output with one system call, bypassing sys.stdout."
+        s = ''.join(self.pending)
+        del self.pending[:]
+        try:
+            fd = sys.stdout.fileno()
+        except (AttributeError, ValueError): # Not a real file; do our best.
+            sys.stdout.write(s)
+            sys.stdout.flush()
+            return
+        sys.stdout.flush()      # Anything written the usual way goes first.
+        data = s if isinstance(s, bytes) else s.encode(sys.stdout.encoding or 'utf-8')
+        while data:
+            try:
+                n = os.write(fd, data)
+            except OSError as err:
+                if err.errno == errno.EINTR:
+                    continue
+                raise
+            data = data[n:]
+
+    def read(self, timeout):
+        """Wait up to timeout seconds for input, then return all that's
+        available (as bytes), '' at end of input, or None if none came."""
+        fd = sys.stdin.fileno()
+        if not wait_for_input(fd, timeout):
+            return None
+        while True:
+            try:
+                return os.read(fd, 4096)
+            except OSError as err: # (Python 2, on a SIGWINCH)
+                if err.errno != errno.EINTR:
+                    raise
+
+    def clock(self):
+        "Return the time in seconds, for pacing frames."
+        return time.time()
+
+    def colors(self):
+        "Return how many colors it shows (see color_depth)."
+        if self.depth is None:
+            self.depth = detect_color_depth()
+        return self.depth
+
+backend = Terminal()
 
 
 # Rendering with styles and cursor marker.
@@ -55,35 +178,210 @@ def write(s):
 
 cursor = object()
 
+# How render() brings the screen up to date:
+#   'lines': send only the lines that differ from the last frame, each
+#            addressed to its row (unless a full repaint is shorter).
+#   'cells': send only the runs of characters that differ, with the
+#            fewest cursor moves and attribute changes we can manage.
+#   'full':  repaint the whole screen every frame.
+repainting = 'lines'
+
 def render(*scene):
-    out = sys.stdout.write
-    out(home_and_hide)
-    cursor_seen = top_paint(scene)
-    # TODO: save *this* cursor position too and restore it on mode-exit
-    # XXX the clear_to_bottom works only in Python 2, not 3.
-    #   Some unicode encoding thing?
-    out(clear_to_bottom)
-    if cursor_seen:
-        out(restore_and_show)
-    sys.stdout.flush()
-
-def top_paint(scene):
+    global held_scene
+    if frame_delay() > 0:
+        if held_scene is not None:
+            frame_counts['dropped'] += 1
+        held_scene = scene
+    else:
+        held_scene = None
+        paint_frame(scene)
+
+def paint_frame(scene):
+    global next_frame_time
+    if viewport is None:
+        screen = grid_state if repainting == 'cells' else screen_state
+    else:
+        screen = clipped_grid if repainting == 'cells' else clipped_screen
+    if stats is None:
+        top_paint(scene, screen)
+        if writer_thread is None:
+            backend.write(screen.update())
+            backend.flush()
+        else:
+            writer_thread.put_frame(screen)
+    else:
+        stats.time_frame(scene, screen)
+    frame_counts['rendered'] += 1
+    if max_fps:
+        next_frame_time = backend.clock() + 1.0 / max_fps
+
+# When max_fps is set, render() paints no more often than that. A scene
+# that comes too soon is held back, replacing (dropping) any scene held
+# already, and gets painted once its time comes: as get_key() waits for
+# input, or on leaving the mode. So the screen shows the latest scene
+# within a frame's time, and a flood of keys can't flood the terminal.
+max_fps = None
+frame_counts = {'rendered': 0, 'dropped': 0}
+held_scene = None
+next_frame_time = 0
+
+def frame_delay():
+    "How many seconds until we may paint another frame."
+    return next_frame_time - backend.clock() if max_fps else 0
+
+def render_held():
+    global held_scene
+    if held_scene is not None:
+        scene, held_scene = held_scene, None
+        paint_frame(scene)
+
+# Sending output from another thread. When threaded_output is set,
+# entering a mode starts a thread to send the output, so a slow
+# terminal can't stall the program. Each painted frame is queued for
+# it, replacing any frame still waiting, and the thread works out how
+# to update the screen from what it actually sent last. So however
+# far behind the terminal falls, it catches up with the latest frame.
+# Other output (from write(), say) is queued too and never dropped;
+# the queue holds that much at most before write() waits.
+threaded_output = False
+writer_thread = None            # The Writer, while it's running.
+
+def start_writer(limit=64):
+    global writer_thread
+    if writer_thread is None:
+        writer_thread = Writer(limit)
+
+def stop_writer():
+    "Wait for the writer to send everything queued, then stop it."
+    global writer_thread
+    if writer_thread is not None:
+        writer_thread.stop()
+        writer_thread = None
+
+class Writer(object):
+
+    def __init__(self, limit):
+        import threading        # (Imported only when needed, to start up faster.)
+        self.limit = limit
+        self.queue = collections.deque() # of (frame, text, stale) with frame or text None
+        self.changed = threading.Condition()
+        self.stale = False      # Must the next frame repaint everything? (After a resize.)
+        self.stopping = False
+        self.sent = self.dropped = 0  # Frames sent and frames superseded.
+        self.error = None       # What stopped the thread, if it failed.
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def depth(self):
+        "How many items are waiting to be sent."
+        return len(self.queue)
+
+    def put_frame(self, screen):
+        "Queue a copy of screen to send, in place of any frame waiting."
+        import copy
+        screen = copy.copy(screen)
+        with self.changed:
+            texts = [item for item in self.queue if item[0] is None]
+            self.dropped += len(self.queue) - len(texts)
+            self.queue = collections.deque(texts)
+            self.queue.append((screen, None, False))
+            self.changed.notify_all()
+
+    def put_text(self, s, stale=False):
+        with self.changed:
+            while self.limit <= len(self.queue) and self.thread.is_alive():
+                self.changed.wait()
+            self.queue.append((None, s, stale))
+            self.changed.notify_all()
+
+    def stop(self):
+        with self.changed:
+            self.stopping = True
+            self.changed.notify_all()
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        try:
+            self.send_all()
+        except Exception as err:
+            self.error = err
+            with self.changed:
+                self.changed.notify_all()  # (Don't leave put_text() waiting.)
+
+    def send_all(self):
+        global shown
+        while True:
+            with self.changed:
+                while not self.queue and not self.stopping:
+                    self.changed.wait()
+                if not self.queue:
+                    return
+                screen, text, stale = self.queue.popleft()
+                self.changed.notify_all()
+            if screen is not None:
+                if self.stale:
+                    self.stale = False
+                    shown = None
+                text = screen.update()
+                self.sent += 1
+            backend.write(text)
+            backend.flush()
+            if stale:
+                shown = None    # (Only once the text is out, not before.)
+
+def top_paint(scene, screen=None):
+    screen = screen or screen_state
     state = default_state.copy()
-    screen_state.cursor_seen = False
-    paint(screen_state, state, scene)
+    screen.clear()
+    screen.cursor_seen = False
+    screen.nodes = paint(screen, state, scene)
     assert state == default_state
-    paint(screen_state, state, '')
-    assert state == default_state
-    assert screen_state.fg == default_state.fg
-    assert screen_state.bg == default_state.bg
-    assert screen_state.styles == default_state.styles
-    return screen_state.cursor_seen
+    screen.put(state, '')
+    screen.end_line()
+    assert screen.fg == default_state.fg
+    assert screen.bg == default_state.bg
+    assert screen.styles == default_state.styles
+    return screen.cursor_seen
+
+# What the terminal is showing, as of our last update, or None if
+# we're not sure. (Its form depends on the kind of screen that sent
+# it; see the update() methods.)
+shown = None
+shown_size = None               # (ROWS, COLS, repainting or 'panes') as of then
+
+def invalidate():
+    "Make the next render() repaint the whole screen."
+    global shown
+    shown = None
+    if writer_thread is not None:
+        writer_thread.stale = True  # (It may be using `shown` right now.)
+
+def note_shown(frame, kind=None):
+    global shown, shown_size
+    shown, shown_size = frame, (ROWS, COLS, kind or repainting)
+
+def can_update(fits):
+    "Can we update the screen in place, given the shown frame?"
+    return fits and shown is not None and shown_size == (ROWS, COLS, repainting)
+
+def goto(row, col=0):
+    return '\x1b[%dH' % (row+1) if col == 0 else '\x1b[%d;%dH' % (row+1, col+1)
 
 home_and_hide    = home + cursor_hide
 restore_and_show = cursor_restore + cursor_show
 newline          = clear_to_right + '\r\n'
 
-def sgr(num): return '\x1b[%dm' % num
+def sgr(num):
+    try:
+        return sgr_codes[num]
+    except KeyError:
+        code = sgr_codes[num] = '\x1b[%sm' % num
+        return code
+
+sgr_codes = {}
 
 class State(object):
     def __init__(self, fg, bg, styles, cursor_seen):
@@ -100,72 +398,632 @@ class State(object):
                 and self.styles == other.styles
                 and self.cursor_seen == other.cursor_seen)
 
-def paint(screen, state, scene):
-    if isinstance(scene, str):    # XXX py2/3
-        if screen.styles != state.styles:
-            sys.stdout.write(sgr(0)); screen.fg = 39; screen.bg = 49
-            if state.styles & (1 << 1): sys.stdout.write(sgr(1))
-            if state.styles & (1 << 4): sys.stdout.write(sgr(4))
-            if state.styles & (1 << 5): sys.stdout.write(sgr(5))
-            if state.styles & (1 << 7): sys.stdout.write(sgr(7))
-            screen.styles = state.styles
-        if screen.fg != state.fg:
-            sys.stdout.write(sgr(state.fg))
-            screen.fg = state.fg
-        if screen.bg != state.bg:
-            sys.stdout.write(sgr(state.bg))
-            screen.bg = state.bg
-        sys.stdout.write(scene.replace('\n', newline))
-    elif scene is cursor:
-        sys.stdout.write(cursor_save)
-        screen.cursor_seen = True
-    elif hasattr(scene, 'paint'):
-        scene.paint(screen, state)
+# Attributes are also passed around as (fg, bg, styles) tuples. A color
+# is an SGR code: 30-37 or 90-97 (bright) for foreground, 40-47 or
+# 100-107 for background, 39 and 49 for the defaults; or else a string
+# like '38;5;208' (from the 256-color palette) or '48;2;255;128;0' (RGB).
+default_attrs = (39, 49, 0)
+
+# Each style as (bit in State.styles, SGR code to set, SGR code to reset).
+style_codes = ((1 << 1, 1, 22), (1 << 4, 4, 24), (1 << 5, 5, 25), (1 << 7, 7, 27))
+
+def sgr_change(old, new):
+    "Return the shortest escape sequence changing attributes old to new."
+    if old == new:
+        return ''
+    depth = known_color_depth()
+    try:
+        return sgr_changes[old, new]
+    except KeyError:
+        pass
+    (fg0, bg0, styles0), (fg, bg, styles) = old, new
+    fg0, bg0, fg, bg = [downgrade(color, depth) for color in (fg0, bg0, fg, bg)]
+    # We can either turn off just the styles that are going away...
+    params = [(on if styles & bit else off)
+              for bit, on, off in style_codes
+              if (styles ^ styles0) & bit]
+    if fg != fg0: params.append(fg)
+    if bg != bg0: params.append(bg)
+    # ...or reset everything and build back up.
+    reset = [0] + [on for bit, on, _ in style_codes if styles & bit]
+    if fg != 39: reset.append(fg)
+    if bg != 49: reset.append(bg)
+    if not params:              # (The same colors, as the terminal shows them.)
+        result = ''
+    else:
+        result = min(('\x1b[%sm' % ';'.join(map(str, ps)) for ps in (params, reset)),
+                     key=len)
+    sgr_changes[old, new] = result
+    return result
+
+sgr_changes = {}                # (Made for depth_in_use.)
+
+## sgr_change((39, 49, 0), (31, 44, 2))
+#. '\x1b[1;31;44m'
+## sgr_change((31, 44, 2|16), (31, 44, 16))
+#. '\x1b[22m'
+## sgr_change((31, 44, 2|16), (39, 49, 0))
+#. '\x1b[0m'
+
+# How many colors the terminal shows: 8, 16, 256, or 2**24 (any RGB).
+# Colors beyond it come out as the nearest it has. None means to ask
+# the backend, the first time it matters in each mode; set it to
+# override that.
+color_depth = None
+depth_in_use = None             # What we're going by, once we know.
+
+def known_color_depth():
+    "Return depth_in_use, making sure it's up to date first."
+    if depth_in_use is None or color_depth not in (None, depth_in_use):
+        note_color_depth()
+    return depth_in_use
+
+def note_color_depth():
+    global depth_in_use
+    depth = color_depth or backend.colors()
+    if depth != depth_in_use:
+        sgr_changes.clear()
+        depth_in_use = depth
+
+def detect_color_depth():
+    "Guess how many colors the terminal can show."
+    if os.environ.get('COLORTERM') in ('truecolor', '24bit'):
+        return 2**24
+    try:
+        import curses
+        curses.setupterm()
+        n = curses.tigetnum('colors')
+    except Exception:           # (No curses, no terminal, unknown $TERM...)
+        return 8
+    return max([8] + [depth for depth in (16, 256, 2**24) if depth <= n])
+
+def downgrade(color, depth):
+    "Return the color code nearest to color among those of a terminal of depth."
+    if not isinstance(color, str):
+        if depth < 16 and (90 <= color <= 97 or 100 <= color <= 107):
+            return color - 60
+        return color
+    params = [int(p) for p in color.split(';')]
+    if params[1] == 5:
+        if depth >= 256: return color
+        rgb = palette_rgb(params[2])
     else:
-        for part in scene:
-            paint(screen, state, part)
+        if depth >= 2**24: return color
+        rgb = tuple(params[2:5])
+        if depth >= 256: return '%d;5;%d' % (params[0], nearest_in_palette(rgb))
+    base = params[0] - 8        # 30 for foreground, 40 for background.
+    i = min(range(min(depth, 16)), key=lambda i: distance(rgb, palette_rgb(i)))
+    return base + i if i < 8 else base + 60 + i - 8
+
+## downgrade('38;2;250;0;0', 256), downgrade('38;2;250;0;0', 16), downgrade('48;5;208', 8)
+#. ('38;5;196', 91, 43)
+
+def palette_rgb(n):
+    "Return the usual RGB value of color n of the 256-color palette."
+    if n < 16:
+        return basic_rgb[n]
+    if n < 232:
+        n -= 16
+        return cube_levels[n // 36], cube_levels[n // 6 % 6], cube_levels[n % 6]
+    gray = 8 + 10 * (n - 232)
+    return gray, gray, gray
+
+# (As in xterm.)
+basic_rgb = ((0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+             (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+             (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+             (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255))
+cube_levels = (0, 95, 135, 175, 215, 255)
+
+def nearest_in_palette(rgb):
+    "Return the index of the palette color nearest rgb, from the cube or the grays."
+    r, g, b = [min(range(6), key=lambda i: abs(cube_levels[i] - v)) for v in rgb]
+    gray = 232 + min(23, max(0, (sum(rgb) // 3 - 3) // 10))
+    return min((16 + 36*r + 6*g + b, gray), key=lambda i: distance(rgb, palette_rgb(i)))
+
+def distance(rgb1, rgb2):
+    return sum((v1 - v2)**2 for v1, v2 in zip(rgb1, rgb2))
+
+class Screen(State):
+    """The state of the terminal once the text painted so far is sent,
+    along with that text, as a list of lines."""
+    full = False                # True when no more can be painted.
+    def __init__(self):
+        State.__init__(self, 39, 49, 0, False)
+        self.nodes = 0          # How many scene nodes the last frame had.
+        self.clear()
+
+    def clear(self):
+        self.lines  = []        # The finished lines...
+        self.widths = []        # ...and how many columns each takes.
+        self.line   = []        # Pieces of the line being painted.
+        self.width  = 0
+
+    def restyle(self, state):
+        "Bring our attributes to the state's."
+        new = (state.fg, state.bg, state.styles)
+        self.line.append(sgr_change((self.fg, self.bg, self.styles), new))
+        self.fg, self.bg, self.styles = new
+
+    def put(self, state, text):
+        if (self.fg != state.fg or self.bg != state.bg
+            or self.styles != state.styles):
+            self.restyle(state)
+        self.line.append(text)
+        self.width += len(text)
+
+    def put_cursor(self):
+        self.line.append(cursor_save)
+        self.cursor_seen = True
+
+    def end_line(self):
+        # Leave the default attributes at the end of each line, so any
+        # line can be resent by itself.
+        line = self.line
+        if self.width != COLS:  # (At the margin, this would erase the last column.)
+            line.append(clear_to_right)
+        line.append(sgr_change((self.fg, self.bg, self.styles), default_attrs))
+        self.fg, self.bg, self.styles = default_attrs
+        self.lines.append(''.join(line))
+        self.widths.append(self.width)
+        del line[:]
+        self.width = 0
+
+    def record(self, state, scene):
+        """Paint scene as if onto us, but only return a 'run' to
+        replay() later, or None if the scene spans lines."""
+        scratch = Screen()
+        scratch.fg, scratch.bg, scratch.styles = self.fg, self.bg, self.styles
+        paint(scratch, state.copy(), scene)
+        if scratch.lines:
+            return None
+        return (''.join(scratch.line), scratch.width,
+                (scratch.fg, scratch.bg, scratch.styles), scratch.cursor_seen)
+
+    def replay(self, run):
+        text, width, attrs, cursor_seen = run
+        self.line.append(text)
+        self.width += width
+        self.fg, self.bg, self.styles = attrs
+        self.cursor_seen = self.cursor_seen or cursor_seen
+
+    def update(self):
+        "Return the output to bring the terminal from `shown` to us."
+        lines = self.lines
+        # TODO: save *this* cursor position too and restore it on mode-exit
+        out = home_and_hide + '\r\n'.join(lines) + clear_below(len(lines))
+        fits = len(lines) <= ROWS and all(w <= COLS for w in self.widths)
+        if repainting == 'lines' and can_update(fits):
+            changes = changed_lines(shown, lines)
+            if not changes:
+                return ''       # (Even the cursor is the same.)
+            if len(changes) < len(out):
+                out = changes
+        note_shown(lines if fits else None)
+        if self.cursor_seen:
+            out += restore_and_show
+        return out
+
+def clear_below(nlines):
+    "Return the output to clear the screen past our nlines just sent."
+    # (Not just clear_to_bottom: after a line reaching the right margin,
+    # that would erase its last character. But with no lines sent, we're
+    # still at home, and must clear from there.)
+    if nlines == 0:
+        return clear_to_bottom
+    return '\r\n' + clear_to_bottom if nlines < ROWS else ''
+
+def changed_lines(old, new):
+    "Return the output to replace the lines `old` by `new` in place."
+    # Lines are self-contained (see Screen.end_line), so any subset of
+    # them may be sent, in any order.
+    out = []
+    for row, line in enumerate(new):
+        if row >= len(old) or line != old[row]:
+            out.append(goto(row))
+            out.append(line)
+    if len(new) < len(old):
+        out.append(goto(len(new)))
+        out.append(clear_to_bottom)
+    if out:
+        out.insert(0, cursor_hide)
+    return ''.join(out)
+
+class Grid(Screen):
+    """Like a Screen, but holding the painted text as rows of cells,
+    each a (character, attributes) pair, for updating cell by cell.
+    (This assumes each character takes one column.)"""
+
+    def clear(self):
+        self.rows  = []         # The finished rows of cells...
+        self.fills = []         # ...and the background color past the end of each.
+        self.row   = []         # The row being painted.
+        self.cursor_at = None   # (row, column) of the cursor marker
+
+    def put(self, state, text):
+        attrs = self.fg, self.bg, self.styles = state.fg, state.bg, state.styles
+        self.row.extend([(ch, attrs) for ch in text])
+
+    def put_cursor(self):
+        self.cursor_at = len(self.rows), len(self.row)
+        self.cursor_seen = True
+
+    def record(self, state, scene):
+        scratch = Grid()
+        scratch.fg, scratch.bg, scratch.styles = self.fg, self.bg, self.styles
+        paint(scratch, state.copy(), scene)
+        if scratch.rows:
+            return None
+        cursor_col = scratch.cursor_at and scratch.cursor_at[1]
+        return (scratch.row, (scratch.fg, scratch.bg, scratch.styles), cursor_col)
+
+    def replay(self, run):
+        cells, attrs, cursor_col = run
+        if cursor_col is not None:
+            self.cursor_at = len(self.rows), len(self.row) + cursor_col
+            self.cursor_seen = True
+        self.row.extend(cells)
+        self.fg, self.bg, self.styles = attrs
+
+    def end_line(self):
+        self.rows.append(self.row)
+        self.fills.append(self.bg)
+        self.row = []
+        self.fg, self.bg, self.styles = default_attrs
+
+    def update(self):
+        "Return the output to bring the terminal from `shown` to us."
+        frame = self.rows, self.fills, self.cursor_at
+        fits = len(self.rows) <= ROWS and all(len(row) <= COLS for row in self.rows)
+        if repainting == 'cells' and can_update(fits):
+            if shown == frame:
+                return ''
+            out = CellWriter(shown).update(*frame)
+        else:
+            out = CellWriter(None).repaint(*frame)
+        note_shown(frame if fits else None)
+        return out
+
+# Clipping. Normally all of a scene gets sent, even the parts that
+# don't fit on the screen, and the terminal wraps and scrolls them.
+# When `viewport` is set to (top, left, rows, cols), we show only that
+# rectangle of the scene: `rows` lines from line `top`, `cols` columns
+# from column `left`. (rows or cols may be None, meaning the screen's.)
+# Once the rectangle is filled, we stop painting: what comes after in
+# the scene doesn't even get generated.
+viewport = None
+
+class Clipping(object):
+    "Mixed into a Screen class, shows only what's in the viewport."
+
+    def clear(self):
+        super(Clipping, self).clear()
+        top, left, rows, cols = self.view()
+        self.top, self.bottom = top, top + min(rows or ROWS, ROWS)
+        self.left, self.right = left, left + min(cols or COLS, COLS)
+        self.scene_row = self.scene_col = 0
+        self.full = self.bottom <= self.top
+
+    def put(self, state, text):
+        col = self.scene_col
+        self.scene_col = col + len(text)
+        # (Even when none of the text shows, pass what does, if only
+        # '', so the rest of the row still takes its style.)
+        if self.top <= self.scene_row < self.bottom and col <= self.right:
+            super(Clipping, self).put(state, text[max(0, self.left - col):self.right - col])
+
+    def put_cursor(self):
+        if (self.top <= self.scene_row < self.bottom
+            and self.left <= self.scene_col < self.right):
+            super(Clipping, self).put_cursor()
+
+    def end_line(self):
+        if self.full:
+            return
+        if self.top <= self.scene_row:
+            super(Clipping, self).end_line()
+        self.scene_row += 1
+        self.scene_col = 0
+        self.full = self.bottom <= self.scene_row
+
+    def view(self):
+        return viewport or (0, 0, None, None)
+
+    def record(self, state, scene):
+        return None             # (A run could straddle the edge.)
+
+class ClippedScreen(Clipping, Screen): pass
+class ClippedGrid(Clipping, Grid): pass
+
+class CellWriter(object):
+    "Produce the output to change the screen from one frame of cells to another."
+
+    def __init__(self, old):
+        self.old = old
+        self.out = [cursor_hide]
+        self.attrs = default_attrs  # The terminal's current attributes
+        self.at = None              # and (row, column), when known.
+
+    def repaint(self, rows, fills, cursor_at):
+        self.out.append(home)
+        for r, row in enumerate(rows):
+            if r: self.out.append('\r\n')
+            self.put(row, 0, len(row))
+            if len(row) != COLS:    # (At the margin, it'd erase the last column.)
+                self.clear_right(fills[r])
+        self.set_attrs(default_attrs)
+        self.out.append(clear_below(len(rows)))
+        return self.finish(cursor_at)
+
+    def update(self, rows, fills, cursor_at):
+        old_rows, old_fills, _ = self.old
+        for r, row in enumerate(rows):
+            if r < len(old_rows):
+                old_row, old_fill = old_rows[r], old_fills[r]
+            else:
+                old_row, old_fill = [], 49  # (cleared by clear_to_bottom)
+            if row == old_row and fills[r] == old_fill:
+                continue
+            n, n_old = len(row), len(old_row)
+            for start, end in self.runs(row, old_row):
+                self.move(r, start)
+                self.put(row, start, end)
+            if n < COLS and (n < n_old or fills[r] != old_fill):
+                self.move(r, n)
+                self.clear_right(fills[r])
+        if len(rows) < len(old_rows):
+            self.move(len(rows), 0)
+            self.set_attrs(default_attrs)
+            self.out.append(clear_to_bottom)
+        self.set_attrs(default_attrs)
+        return self.finish(cursor_at)
+
+    def update_region(self, top, left, rows, old_rows):
+        """Change the rectangle at (top, left) from old_rows of cells (or
+        from blank, if None) to rows, without touching the rest of the line."""
+        width = max(0, COLS - left)
+        for r, row in enumerate(rows[:max(0, ROWS - top)]):
+            row = row[:width]
+            old_row = old_rows[r][:width] if old_rows else [blank_cell] * len(row)
+            if row != old_row:
+                for start, end in self.runs(row, old_row):
+                    self.move(top + r, left + start)
+                    self.put(row, start, end, left)
+
+    def runs(self, row, old_row):
+        "Yield (start, end) spans of row that differ from old_row."
+        n_old = len(old_row)
+        start = end = None
+        for c, cell in enumerate(row):
+            if c < n_old and cell == old_row[c]:
+                continue
+            if start is not None:
+                # Rather than skip a short gap of unchanged cells,
+                # resend it, when that's shorter than moving over it.
+                gap = c - end
+                if gap < 4 and all(a == row[end-1][1] for _, a in row[end:c]):
+                    end = c + 1
+                    continue
+                yield start, end
+            start, end = c, c + 1
+        if start is not None:
+            yield start, end
+
+    def put(self, row, start, end, left=0):
+        out = self.out
+        attrs = self.attrs
+        for ch, a in row[start:end]:
+            if a != attrs:
+                out.append(sgr_change(attrs, a))
+                attrs = a
+            out.append(ch)
+        self.attrs = attrs
+        if self.at is not None:
+            r, _ = self.at
+            end += left
+            # At the right margin the terminal may be waiting to wrap.
+            self.at = (r, end) if end < COLS else None
+
+    def clear_right(self, fill):
+        fg, _, styles = self.attrs
+        self.set_attrs((fg, fill, styles))
+        self.out.append(clear_to_right)
+
+    def set_attrs(self, attrs):
+        self.out.append(sgr_change(self.attrs, attrs))
+        self.attrs = attrs
+
+    def move(self, row, col):
+        "Move the cursor to (row, col) by the shortest escape sequence."
+        if self.at != (row, col):
+            moves = [goto(row, col)]
+            if self.at is not None:
+                r, c = self.at
+                if r == row:
+                    if col == 0: moves.append('\r')
+                    elif c < col: moves.append('\x1b[%dC' % (col - c))
+                    moves.append('\x1b[%dG' % (col+1))
+                elif r+1 == row and col == 0:
+                    moves.append('\r\n')
+            self.out.append(min(moves, key=len))
+        self.at = (row, col)
+
+    def finish(self, cursor_at):
+        if cursor_at is not None:
+            self.move(*cursor_at)
+            self.out.append(cursor_show)
+        return ''.join(self.out)
+
+# Panes. A frame can be made of rectangular panes, each showing its
+# own scene, instead of one scene for the whole screen. A pane gets
+# repainted only when it's given a new scene, and then only the cells
+# that changed get sent:
+#     words, grams = sturm.Pane(0, 0, 20, 10), sturm.Pane(0, 11, 20, 60)
+#     words.show(...); grams.show(...)
+#     sturm.render_panes(words, grams)
+#     grams.show(...)   # Later, with words left alone.
+#     sturm.render_panes(words, grams)
+# Scenes are clipped to their panes.
+
+class Pane(object):
+    "A rectangle of the screen, showing a scene."
+
+    def __init__(self, top, left, rows, cols):
+        self.top, self.left, self.rows, self.cols = top, left, rows, cols
+        self.scene = ()
+        self.dirty = True       # Does the scene need repainting?
+        self.cells = None       # Its rows of cells, as last painted,
+        self.cursor_at = None   # and the cursor marker's place in them.
+
+    def show(self, *scene):
+        "Show a new scene at the next render_panes()."
+        self.scene = scene
+        self.dirty = True
+
+    def repaint(self):
+        grid = PaneGrid(self.rows, self.cols)
+        top_paint(self.scene, grid)
+        cells = [row + [(' ', (39, fill, 0))] * (self.cols - len(row))
+                 for row, fill in zip(grid.rows, grid.fills)]
+        cells.extend([[blank_cell] * self.cols] * (self.rows - len(cells)))
+        self.cells, self.cursor_at = cells, grid.cursor_at
+        self.dirty = False
+
+class PaneGrid(Clipping, Grid):
+    def __init__(self, rows, cols):
+        self.size = rows, cols
+        Grid.__init__(self)
+    def view(self):
+        return (0, 0) + self.size
+
+blank_cell = (' ', default_attrs)
+
+def render_panes(*panes):
+    """Update the screen to show the panes, repainting only the dirty
+    ones (unless the whole screen needs repainting)."""
+    fresh = not (shown == panes and shown_size == (ROWS, COLS, 'panes'))
+    if not fresh and not any(pane.dirty for pane in panes):
+        return
+    writer = CellWriter(None)
+    if fresh:
+        writer.out.append(home + clear_to_bottom)
+    cursor_at = None
+    for pane in panes:
+        if ROWS <= pane.top or COLS <= pane.left:
+            continue            # (Off the screen: it'll get painted once it's on.)
+        # (A clean pane is just resent as it was: its scene may be
+        # something, like a generator, that can't be painted twice.)
+        if pane.dirty:
+            old = None if fresh else pane.cells
+            pane.repaint()
+            writer.update_region(pane.top, pane.left, pane.cells, old)
+        elif fresh:
+            writer.update_region(pane.top, pane.left, pane.cells, None)
+        if pane.cursor_at is not None:
+            r, c = pane.cursor_at
+            cursor_at = pane.top + r, pane.left + c
+    writer.set_attrs(default_attrs)
+    send(writer.finish(cursor_at))
+    note_shown(panes, 'panes')
+
+def paint(screen, state, scene):
+    """Paint scene onto screen, starting in state. Return how many nodes
+    of the scene we visited. We walk nested iterables and Styled scenes
+    with an explicit stack, so the nesting can go arbitrarily deep. We
+    stop early once the screen is full."""
+    stack = []            # The (parts, restore) pairs we'll return to.
+    parts = iter((scene,))
+    restore = None        # The attributes to restore after parts, if any.
+    saved = state.fg, state.bg, state.styles
+    nodes = 0
+    try:
+        while True:
+            for scene in parts:
+                nodes += 1
+                if isinstance(scene, text_types):
+                    if '\n' in scene:
+                        lines = scene.split('\n')
+                        for line in lines[:-1]:
+                            # (Even an empty line gets restyled, since the end of
+                            # line is cleared in the current background color.)
+                            screen.put(state, line)
+                            screen.end_line()
+                        if screen.full:
+                            return nodes
+                        scene = lines[-1]
+                    if scene:
+                        screen.put(state, scene)
+                elif scene.__class__ is Styled:
+                    fg, bg, styles = state.fg, state.bg, state.styles
+                    new_fg, new_bg, new_styles, scene = scene
+                    if new_fg is not None: state.fg = new_fg
+                    if new_bg is not None: state.bg = new_bg
+                    state.styles = styles | new_styles
+                    if isinstance(scene, text_types) and '\n' not in scene:
+                        # The usual case, painted right here.
+                        nodes += 1
+                        if scene:
+                            screen.put(state, scene)
+                        state.fg, state.bg, state.styles = fg, bg, styles
+                        continue
+                    stack.append((parts, restore))
+                    restore = fg, bg, styles
+                    if isinstance(scene, text_types) or scene is cursor or hasattr(scene, 'paint'):
+                        parts = iter((scene,))
+                    else:
+                        nodes += 1
+                        parts = iter(scene)
+                    break
+                elif scene is cursor:
+                    screen.put_cursor()
+                elif hasattr(scene, 'paint'):
+                    scene.paint(screen, state)
+                    if screen.full:
+                        return nodes
+                else:
+                    stack.append((parts, restore))
+                    parts, restore = iter(scene), None
+                    break
+            else:
+                if restore is not None:
+                    state.fg, state.bg, state.styles = restore
+                if not stack:
+                    return nodes
+                parts, restore = stack.pop()
+    finally:
+        # (Needed only if we stopped early, on an error or a full screen.)
+        state.fg, state.bg, state.styles = saved
 
 class Painter(object):
+    "A scene that paints itself by calling paint(screen, state)."
     def __init__(self, paint):
         self.paint = paint
 
+class Styled(tuple):
+    """A scene painted with some attributes changed: (fg, bg, styles,
+    scene), where fg and bg are color codes, or None to leave as is,
+    and styles is a mask of styles to add. (A tuple to make it cheap
+    to create.)"""
+    __slots__ = ()
+    def paint(self, screen, state):
+        paint(screen, state, self)
+
 def ForegroundColor(name, code):
     def Attribute(subscene):
-        def subpaint(screen, state):
-            fg = state.fg
-            state.fg = code
-            try:
-                paint(screen, state, subscene)
-            finally:
-                state.fg = fg
-        return Painter(subpaint)
+        return Styled((code, None, 0, subscene))
     Attribute.__name__ = name
     return Attribute
 
 def BackgroundColor(name, code):
     def Attribute(subscene):
-        def subpaint(screen, state):
-            bg = state.bg
-            state.bg = code
-            try:
-                paint(screen, state, subscene)
-            finally:
-                state.bg = bg
-        return Painter(subpaint)
+        return Styled((None, code, 0, subscene))
     Attribute.__name__ = name
     return Attribute
 
 def Style(name, code):
     mask = 1 << code
     def Attribute(subscene):
-        def subpaint(screen, state):
-            styles = state.styles
-            state.styles |= mask
-            try:
-                paint(screen, state, subscene)
-            finally:
-                state.styles = styles
-        return Painter(subpaint)
+        return Styled((None, None, mask, subscene))
     Attribute.__name__ = name
     return Attribute
 
@@ -177,19 +1035,74 @@ on_black, on_red, on_green, on_yellow, on_blue, on_magenta, on_cyan, on_white =
   [BackgroundColor('on_'+name, code) for name,code in zip(colors, range(40, 48))]
 on_default = BackgroundColor('on_default', 49)
 
+bright_black, bright_red, bright_green, bright_yellow, \
+bright_blue, bright_magenta, bright_cyan, bright_white = \
+  [ForegroundColor('bright_'+name, code) for name,code in zip(colors, range(90, 98))]
+on_bright_black, on_bright_red, on_bright_green, on_bright_yellow, \
+on_bright_blue, on_bright_magenta, on_bright_cyan, on_bright_white = \
+  [BackgroundColor('on_bright_'+name, code) for name,code in zip(colors, range(100, 108))]
+
+# Colors by number in the 256-color palette, or by red, green, and blue
+# levels from 0 to 255. (Each call makes a new function; make it once.)
+def color(n):          return ForegroundColor('color(%d)' % n, '38;5;%d' % n)
+def on_color(n):       return BackgroundColor('on_color(%d)' % n, '48;5;%d' % n)
+def rgb(r, g, b):      return ForegroundColor('rgb(%d, %d, %d)' % (r, g, b), '38;2;%d;%d;%d' % (r, g, b))
+def on_rgb(r, g, b):   return BackgroundColor('on_rgb(%d, %d, %d)' % (r, g, b), '48;2;%d;%d;%d' % (r, g, b))
+
 bold       = Style('bold',       1)
 underlined = Style('underlined', 4)
 blinking   = Style('blinking',   5)
 inverted   = Style('inverted',   7)
 
 default_state = State(39, 49, 0, False)
-screen_state  = default_state.copy()
+screen_state  = Screen()
+grid_state    = Grid()
+clipped_screen = ClippedScreen()
+clipped_grid   = ClippedGrid()
 
 # Often handy to combine styles:
 def unstyled(x):    return x
 def compose(*fns):  return reduce(compose2, fns)
 def compose2(f, g): return lambda x: f(g(x))
 
+# A scene that never changes can be compiled to paint faster: the
+# first time it's painted over some given attributes, we remember the
+# output; painting it there again just repeats that output, instead of
+# walking the scene. (This works for the parts of a scene that stay on
+# one line; others get painted the usual way.)
+
+def compile(scene):
+    "Return an equivalent scene that remembers how it was painted."
+    return Compiled(freeze(scene))
+
+def freeze(scene):
+    "Return scene with any iterators in it made repaintable."
+    if isinstance(scene, text_types) or scene is cursor:
+        return scene
+    if scene.__class__ is Styled:
+        return Styled(scene[:3] + (freeze(scene[3]),))
+    if hasattr(scene, 'paint'):
+        return scene            # (Other painters must look after themselves.)
+    return tuple(map(freeze, scene))
+
+class Compiled(object):
+    def __init__(self, scene):
+        self.scene = scene
+        self.runs = {}
+
+    def paint(self, screen, state):
+        # (The output's escape codes depend on the color depth too.)
+        key = (type(screen), screen.fg, screen.bg, screen.styles,
+               state.fg, state.bg, state.styles, known_color_depth())
+        try:
+            run = self.runs[key]
+        except KeyError:
+            run = self.runs[key] = screen.record(state, self.scene)
+        if run is None:
+            paint(screen, state, self.scene)
+        else:
+            screen.replay(run)
+
 
 # Keyboard input
 
@@ -209,48 +1122,711 @@ key_map = {chr(127): 'backspace',
            esc+'[18~': 'f7',   esc+'[21~': 'f10', esc+'[24~': 'f12',
            esc+'[19~': 'f8'}
 key_map.update({esc+'[1%d~'%n: 'f%d'%n for n in range(1, 6)})
-keymap_prefixes = set(k[:i] for k in key_map for i in range(1, len(k)))
+paste_start, paste_end = esc+'[200~', esc+'[201~'
+key_map[paste_start] = paste_start  # (match_key() reads on to paste_end.)
 # N.B. in raw mode, the enter key is '\r'; in cbreak, it's '\n'.
 # Just let the client deal with that, I guess.
 
+def make_trie(key_map):
+    "Return a tree of dicts, branching on each character of each key sequence."
+    trie = {}
+    for keys, name in key_map.items():
+        node = trie
+        for ch in keys:
+            node = node.setdefault(ch, {})
+        node[None] = name       # (A key sequence ends here.)
+    return trie
+
+key_trie = make_trie(key_map)   # (Remake it if you change key_map.)
+
+# A run of characters none of which can start a key sequence: each is a key.
+plain_run = re.compile('[^%s]+' % re.escape(''.join(key_trie))) # (Ditto.)
+
+# If the input stops partway into a key sequence, how long (in
+# seconds) to wait for the rest before deciding the user hit the
+# escape key themself:
+escape_timeout = 0.05
+# And likewise partway into a bracketed paste:
+paste_timeout = 0.5
+
 def get_key(timeout=None):
-    keys = get_key_unmapped(timeout)
-    if keys is None:
-        return None
-    while keys in keymap_prefixes:
-        key = get_key_unmapped(0)
-        if key is None:
-            # We assume the bytes of a mapped key-sequence must all be
-            # available together; if not, the user must have hit the
-            # escape key themself, and we'll just return that.
+    "Return the next key, or None if none comes within timeout seconds."
+    if stats is not None:
+        return stats.time_key(next_key, timeout)
+    return next_key(timeout)
+
+def next_key(timeout):
+    if held_scene is not None and key_buffer.empty():
+        # Wait for input only until the held frame is due, then paint it.
+        start, delay = backend.clock(), max(0, frame_delay())
+        if timeout is None or delay < timeout:
+            if not key_buffer.fill(delay):
+                render_held()
+                if timeout is not None:
+                    timeout = max(0, timeout - (backend.clock() - start))
+    if key_buffer.empty() and not key_buffer.fill(timeout):
+        return '' if key_buffer.at_eof else None
+    return decode_key()
+
+def get_keys(timeout=None):
+    """Return a list of all the keys typed so far (waiting up to timeout
+    for one). Handle them all, then render once, to keep up with fast
+    input."""
+    key = get_key(timeout)
+    if not key:
+        return []
+    keys = [key]
+    key_buffer.fill(0)
+    while not key_buffer.empty():
+        # Take plain characters a run at a time, without the trie.
+        run = plain_run.match(key_buffer.text, key_buffer.start)
+        if run:
+            keys.extend(run.group())
+            key_buffer.start = run.end()
+        else:
+            keys.append(decode_key())
+    return keys
+
+def decode_key():
+    "Take the next key out of the buffer, which must not be empty."
+    while True:
+        key, end, partial = match_key()
+        if not partial or not key_buffer.fill(wait_for_rest(key)):
             break
-        keys += key
-    if keys in key_map:
-        return key_map[keys]
-    else:
-        key_stack.extend(reversed(keys))
-        return key_stack.pop()
+    key_buffer.start = end
+    return key
 
-def get_key_unmapped(timeout):
-    return key_stack.pop() if key_stack else get_key_timed(timeout)
+def wait_for_rest(key):
+    "How long to wait for the rest of a partial key."
+    return paste_timeout if key[0] == 'paste' else escape_timeout
 
-key_stack = []
+def match_key():
+    """Return the next key in the buffer, where it ends, and whether
+    the buffer ends partway into what might be a longer key sequence."""
+    text, i = key_buffer.text, key_buffer.start
+    node, n = key_trie, len(text)
+    key, end = text[i], i+1     # Unless we match a longer sequence.
+    while i < n and text[i] in node:
+        node = node[text[i]]
+        i += 1
+        if None in node:
+            key, end = node[None], i
+    if key == paste_start:
+        stop = text.find(paste_end, end)
+        if stop < 0:            # (If it never comes, take what we have.)
+            return ('paste', text[end:]), n, True
+        return ('paste', text[end:stop]), stop + len(paste_end), False
+    return key, end, i == n and any(ch is not None for ch in node)
 
-def get_key_timed(timeout):
-    if timeout is None or wait_for_input(sys.stdin.fileno(), timeout):
-        return sys.stdin.read(1)
-    else:
-        return None
+class KeyBuffer(object):
+    "The characters read from the keyboard but not yet decoded as keys."
+
+    def __init__(self):
+        self.text = ''
+        self.start = 0          # Where the undecoded characters start.
+        self.at_eof = False
+        self.decoder = None
+        self.received = 0       # How many characters, ever.
+
+    def empty(self):
+        return len(self.text) <= self.start
+
+    def fill(self, timeout):
+        """Wait up to timeout for input; then read all that's available.
+        Return true if we got any."""
+        if writer_thread is None:
+            backend.flush()     # (Show whatever we're waiting on.)
+        data = backend.read(timeout)
+        if data is None:
+            return False
+        if not data:
+            self.at_eof = True
+            return False
+        if not isinstance(data, str): # (Bytes, in Python 3.)
+            if self.decoder is None:
+                encoding = sys.stdin.encoding or 'utf-8'
+                self.decoder = codecs.getincrementaldecoder(encoding)('replace')
+            data = self.decoder.decode(data)
+        self.received += len(data)
+        self.text = self.text[self.start:] + data
+        self.start = 0
+        return True
+
+key_buffer = KeyBuffer()
 
 def wait_for_input(fd, timeout):
     "Return true if fd is ready to read; wait for timeout at most."
+    deadline = None if timeout is None else time.time() + timeout
     while True:
         r, w, e = [fd], [], [fd]
         try:
             r, w, e = select.select(r, w, e, timeout)
-        except select.error as err:
-            if err[0] == errno.EINTR:
-                timeout = 0  # TODO: is it worth the trouble to adjust this correctly?
-                continue
-            raise
+        except select.error as err: # (Python 2, on a signal like SIGWINCH)
+            if err.args[0] != errno.EINTR:
+                raise
+            if deadline is not None:
+                timeout = max(0, deadline - time.time())
+            continue
         return not not (r or e)
+
+
+
+# Instrumentation
+#
+# To find out where the time goes, call sturm.instrument() (or set the
+# environment variable STURM_STATS to a filename to append to). From
+# then on, each render() and get_key() adds a record to sturm.stats:
+#   render: time (in seconds) spent in top_paint, in working out the
+#           update, and in flushing it; the bytes and SGR sequences it
+#           took; and how many scene nodes were painted (counting
+#           any painter besides Styled as one).
+#   key:    time spent in get_key() (waiting included) and how many
+#           characters of input the key consumed.
+# Each record also has its start time `t`, so the gaps between records
+# are time spent computing in the program itself. (With threaded_output,
+# the update and flush happen in the writer's thread; then `flush` is
+# the time to queue the frame, and `queued` how many items await sending.)
+
+stats = None
+
+def instrument(log=None, window=1000):
+    """Start recording; return the Stats. Keep the last `window` records
+    of each kind, and write every record to `log` (a file), if given,
+    as a line of JSON."""
+    global stats
+    stats = Stats(log, window)
+    return stats
+
+def stop_instrumenting():
+    global stats
+    if stats is not None and stats.log is not None:
+        stats.log.flush()
+    stats = None
+
+class Stats(object):
+
+    def __init__(self, log, window):
+        self.log = log
+        self.records = {'render': collections.deque(maxlen=window),
+                        'key':    collections.deque(maxlen=window)}
+
+    def add(self, record):
+        self.records[record['event']].append(record)
+        if self.log is not None:
+            import json
+            self.log.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def time_frame(self, scene, screen):
+        t0 = time.time()
+        top_paint(scene, screen)
+        t1 = time.time()
+        if writer_thread is not None:
+            # The update happens in the writer's thread, out of our view.
+            writer_thread.put_frame(screen)
+            self.add(dict(event='render', t=t0, paint=t1-t0, flush=time.time()-t1,
+                          nodes=screen.nodes, queued=writer_thread.depth()))
+            return
+        out = screen.update()
+        t2 = time.time()
+        backend.write(out)
+        backend.flush()
+        t3 = time.time()
+        self.add(dict(event='render', t=t0, paint=t1-t0, update=t2-t1, flush=t3-t2,
+                      bytes=len(out if isinstance(out, bytes) else out.encode('utf-8')),
+                      sgr=len(sgr_pattern.findall(out)), nodes=screen.nodes))
+
+    def time_key(self, next_key, timeout):
+        unread = len(key_buffer.text) - key_buffer.start
+        received = key_buffer.received
+        t0 = time.time()
+        key = next_key(timeout)
+        t1 = time.time()
+        unread += key_buffer.received - received
+        self.add(dict(event='key', t=t0, latency=t1-t0,
+                      consumed=unread - (len(key_buffer.text) - key_buffer.start)))
+        return key
+
+    def histogram(self, event='render', field='paint'):
+        """Return a list of (bound, count) over the recent records: how
+        many had field at most bound but more than the next bound down.
+        The bounds are powers of 2 (in milliseconds, for times)."""
+        scale = 1 if field in ('bytes', 'sgr', 'nodes', 'consumed') else 1000
+        counts = {}
+        for record in self.records[event]:
+            if field not in record:
+                continue
+            value = record[field] * scale
+            bound = 2.0 ** math.ceil(math.log(value, 2)) if 0 < value else 0
+            counts[bound] = counts.get(bound, 0) + 1
+        return sorted(counts.items())
+
+    def report(self):
+        "Return a summary of the recent records, as text."
+        lines = []
+        for event, fields in (('render', ('paint', 'update', 'flush', 'bytes', 'sgr', 'nodes')),
+                              ('key', ('latency', 'consumed'))):
+            records = self.records[event]
+            lines.append('%d recent %s calls:%s' % (len(records), event,
+                                                  '' if records else ' none'))
+            for field in (fields if records else ()):
+                lines.append('  %-8s %s' % (field, '  '.join('%g:%d' % pair
+                                                            for pair in self.histogram(event, field))))
+        return '\n'.join(lines)
+
+sgr_pattern = re.compile(r'\x1b\[[\d;]*m')
+
+if os.environ.get('STURM_STATS'):
+    instrument(open(os.environ['STURM_STATS'], 'a', 1)) # (Line-buffered.)
+
+
+# Running under an asyncio event loop (Python 3)
+#
+# Instead of a loop around get_key(timeout) and time.sleep(), you can
+#     async for key in sturm.keys(): ...
+# in one task, and
+#     async for _ in sturm.ticks(interval): ...
+# in another, with each calling sturm.render_soon(scene) when the
+# screen should change. Nothing busy-waits: stdin is watched by the
+# event loop, and timers don't drift.
+
+def keys():
+    "Return an async iterator of keys (ending at end of input)."
+    return KeyStream()
+
+class KeyStream(object):
+
+    def __init__(self):
+        import asyncio
+        self.loop = asyncio.get_event_loop()
+        self.fd = backend.fileno() # (None for a backend we must poll.)
+        self.waiter = None
+        self.timer = None       # For a possibly-partial key sequence.
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        self.waiter = self.loop.create_future()
+        self.poll()
+        if not self.waiter.done():
+            if self.fd is None: self.loop.call_soon(self.on_input)
+            else:               self.loop.add_reader(self.fd, self.on_input)
+        return self.waiter
+
+    def on_input(self):
+        if self.waiter.done():
+            return
+        try:
+            got_some = key_buffer.fill(0)
+        except EOFError as err: # (From a Headless backend out of input.)
+            self.settle(None, err)
+            return
+        if got_some:
+            self.poll()
+        elif key_buffer.at_eof and key_buffer.empty():
+            self.settle(None, StopAsyncIteration())
+        elif self.fd is None and self.timer is None:
+            self.loop.call_soon(self.on_input)
+
+    def poll(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not key_buffer.empty():
+            key, end, partial = match_key()
+            if partial:
+                self.timer = self.loop.call_later(wait_for_rest(key), self.time_out)
+            else:
+                key_buffer.start = end
+                self.settle(key)
+
+    def time_out(self):
+        self.timer = None
+        key, end, _ = match_key()
+        key_buffer.start = end
+        self.settle(key)
+
+    def settle(self, key, error=None):
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+        if not self.waiter.done():
+            if error is None: self.waiter.set_result(key)
+            else:             self.waiter.set_exception(error)
+
+def ticks(interval):
+    """Return an async iterator that yields right away, then every
+    interval seconds after, skipping any ticks it falls behind on."""
+    return Ticks(interval)
+
+class Ticks(object):
+
+    def __init__(self, interval):
+        import asyncio
+        self.loop = asyncio.get_event_loop()
+        self.interval = interval
+        self.deadline = None
+        self.count = 0
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        now = self.loop.time()
+        if self.deadline is None:
+            self.deadline = now
+        else:
+            self.deadline = max(now, self.deadline + self.interval)
+        tick = self.loop.create_future()
+        self.loop.call_at(self.deadline, settle_once, tick, self.count)
+        self.count += 1
+        return tick
+
+def settle_once(future, value):
+    if not future.done():
+        future.set_result(value)
+
+def render_soon(*scene):
+    """Render scene once the event loop gets around to it (and max_fps
+    allows). Requests made before then are coalesced: only the latest
+    scene is rendered."""
+    global pending_scene
+    if pending_scene is None:
+        import asyncio
+        asyncio.get_event_loop().call_soon(render_pending)
+    else:
+        frame_counts['dropped'] += 1
+    pending_scene = scene
+
+pending_scene = None
+
+def render_pending():
+    global pending_scene
+    delay = frame_delay()
+    if 0 < delay:
+        import asyncio
+        asyncio.get_event_loop().call_later(delay, render_pending)
+    elif pending_scene is not None:
+        scene, pending_scene = pending_scene, None
+        render(*scene)
+
+
+# Running without a terminal
+#
+# To run a program with no terminal attached -- to test it, or to time
+# it -- set
+#     sturm.backend = sturm.Headless(['w', 'a', ...])
+# before entering a mode. Input comes from the script; output goes to
+# an imaginary screen, with just enough of a terminal's behavior to
+# show what sturm draws there. Nothing waits on a clock.
+
+class Headless(object):
+    """A stand-in terminal. Each read() takes the next item from the
+    script: a string of input, or None for a read that times out.
+    A read past the end of the script raises EOFError."""
+
+    def __init__(self, script=(), rows=24, cols=80, colors=2**24):
+        self.script = collections.deque(script)
+        self.rows, self.cols = rows, cols
+        self.depth = colors     # (Fixed, so output doesn't depend on the host.)
+        self.mode = None
+        self.bytes_read = self.bytes_written = 0
+        self.flushes = 0
+        self.attrs = default_attrs
+        self.saved = (0, 0)
+        self.row = self.col = 0
+        self.wrap_pending = False  # At the right margin, after writing there.
+        self.cursor_visible = True
+        self.cells = [self.blank_row() for _ in range(rows)]
+
+    def feed(self, *items):
+        "Add items to the end of the script."
+        self.script.extend(items)
+
+    def lines(self):
+        "Return the screen's text, one string per row, without trailing blanks."
+        return [''.join(ch for ch, _ in row).rstrip() for row in self.cells]
+
+    def cursor(self):
+        "Return the cursor's (row, column), or None if it's hidden."
+        return (self.row, self.col) if self.cursor_visible else None
+
+    # The backend methods:
+
+    def fileno(self):
+        return None
+
+    def size(self):
+        return self.rows, self.cols
+
+    def enter(self, name):
+        self.mode = name
+
+    def exit(self, saved):
+        self.mode = None
+
+    def write(self, s):
+        self.bytes_written += len(s if isinstance(s, bytes) else s.encode('utf-8'))
+        for m in vt_token.finditer(s):
+            text, control, private, params, command = m.groups()
+            if text:               self.put_text(text)
+            elif control:          self.control(control)
+            elif command:          self.csi(private, params, command)
+
+    def flush(self):
+        self.flushes += 1
+
+    def read(self, timeout):
+        while self.script:
+            item = self.script.popleft()
+            if item is not None:
+                self.bytes_read += len(item)
+                return item
+            if timeout is not None:
+                return None
+        raise EOFError("Headless terminal's script ran out")
+
+    def clock(self):
+        return time.time()
+
+    def colors(self):
+        return self.depth
+
+    # The imaginary screen:
+
+    def blank_row(self):
+        return [(' ', (39, self.attrs[1], 0))] * self.cols
+
+    def put_text(self, text):
+        row = self.cells[self.row]
+        for ch in text:
+            if self.wrap_pending:
+                self.col = 0
+                self.line_feed()
+                row = self.cells[self.row]
+            row[self.col] = (ch, self.attrs)
+            if self.col < self.cols - 1: self.col += 1
+            else:                        self.wrap_pending = True
+
+    def line_feed(self):
+        self.wrap_pending = False
+        if self.row < self.rows - 1:
+            self.row += 1
+        else:
+            del self.cells[0]
+            self.cells.append(self.blank_row())
+
+    def control(self, ch):
+        if ch == '\n':
+            self.line_feed()
+        else:
+            self.wrap_pending = False
+            if ch == '\r':   self.col = 0
+            elif ch == '\b': self.col = max(0, self.col - 1)
+
+    def csi(self, private, params, command):
+        args = [int(p) if p else 0 for p in params.split(';')]
+        n = max(1, args[0])
+        if command == 'm':
+            self.set_attrs(args)
+            return
+        if private:
+            if params == '25' and command in 'hl':
+                self.cursor_visible = (command == 'h')
+            return
+        if command in 'HABCDGu':
+            self.wrap_pending = False
+        if command == 'H':
+            self.move(n - 1, max(1, (args + [0])[1]) - 1)
+        elif command == 'A': self.move(self.row - n, self.col)
+        elif command == 'B': self.move(self.row + n, self.col)
+        elif command == 'C': self.move(self.row, self.col + n)
+        elif command == 'D': self.move(self.row, self.col - n)
+        elif command == 'G': self.move(self.row, n - 1)
+        elif command == 's': self.saved = (self.row, self.col)
+        elif command == 'u': self.move(*self.saved)
+        elif command == 'K':
+            self.erase(self.row, args[0])
+        elif command == 'J':
+            self.erase(self.row, args[0])
+            rows = {0: range(self.row+1, self.rows), 1: range(self.row), 2: range(self.rows)}
+            for r in rows.get(args[0], ()):
+                self.cells[r] = self.blank_row()
+
+    def move(self, row, col):
+        self.row = min(max(0, row), self.rows - 1)
+        self.col = min(max(0, col), self.cols - 1)
+
+    def erase(self, row, how):  # how: 0 to the right, 1 to the left, 2 all.
+        lo, hi = {0: (self.col, self.cols), 1: (0, self.col+1)}.get(how, (0, self.cols))
+        self.cells[row][lo:hi] = self.blank_row()[lo:hi]
+
+    def set_attrs(self, args):
+        fg, bg, style = self.attrs
+        args = list(args)
+        while args:
+            code = args.pop(0)
+            if code in (38, 48):       # Extended: 38;5;n or 38;2;r;g;b.
+                n = 2 if args[:1] == [5] else 4
+                color = ';'.join(map(str, [code] + args[:n]))
+                del args[:n]
+                if code == 38: fg = color
+                else:          bg = color
+            elif code == 0:                    fg, bg, style = default_attrs
+            elif 30 <= code <= 39 or 90 <= code <= 97:   fg = code
+            elif 40 <= code <= 49 or 100 <= code <= 107: bg = code
+            else:
+                for bit, on, off in style_codes:
+                    if code == on:    style |= bit
+                    elif code == off: style &= ~bit
+        self.attrs = fg, bg, style
+
+vt_token = re.compile(r'([^\x1b\r\n\b]+)|([\r\n\b])|\x1b\[(\??)([\d;]*)([A-Za-z])|\x1b.?')
+
+
+# Recording and replaying sessions
+#
+# Set the environment variable STURM_RECORD to a filename (or call
+# sturm.record()) to log each read of input and each flush of output,
+# as lines of JSON, with `t` the seconds since entering a mode:
+#   {"seed": 123}               seeds `random`, so a replay draws the same
+#   {"size": [24, 80]}          the screen size, when asked
+#   {"t": 1.5, "in": "q"}       input, or "in": null for a read that timed out
+#   {"t": 1.6, "out": "..."}    output
+# (Input that came as bytes is logged as Latin-1 text, with "bytes": true.)
+# Then Replay(filename) is a Headless terminal that feeds the same input
+# to the program again, at full speed or with the original timing, for
+# profiling and for comparing its output with the recording's. (A program
+# that consults the clock itself, or a resized screen, may still diverge.)
+
+def record(log):
+    "Start logging the session to the file `log`, wrapping the backend."
+    global backend
+    backend = Recorder(backend, log)
+    return backend
+
+class Recorder(object):
+
+    def __init__(self, backend, log):
+        import random, threading
+        self.backend = backend
+        self.log = log
+        self.lock = threading.Lock() # (The writer thread flushes, too.)
+        self.start = None
+        self.pending = []
+        self.last_size = self.last_colors = None
+        seed = random.randrange(2**32)
+        random.seed(seed)
+        self.add(dict(seed=seed))
+
+    def add(self, record):
+        if 'in' in record or 'out' in record:
+            record['t'] = round(time.time() - (self.start or time.time()), 6)
+        import json
+        with self.lock:
+            self.log.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def fileno(self):
+        return self.backend.fileno()
+
+    def size(self):
+        size = self.backend.size()
+        if size is not None and size != self.last_size:
+            self.last_size = size
+            self.add(dict(size=list(size)))
+        return size
+
+    def enter(self, name):
+        if self.start is None:
+            self.start = time.time()
+        return self.backend.enter(name)
+
+    def exit(self, saved):
+        self.backend.exit(saved)
+        self.log.flush()
+
+    def write(self, s):
+        self.pending.append(s)
+        self.backend.write(s)
+
+    def flush(self):
+        if self.pending:
+            s = ''.join(self.pending)
+            del self.pending[:]
+            self.add({'out': s})
+        self.backend.flush()
+
+    def read(self, timeout):
+        data = self.backend.read(timeout)
+        if isinstance(data, bytes):
+            self.add({'in': data.decode('latin-1'), 'bytes': True})
+        else:
+            self.add({'in': data})
+        return data
+
+    def clock(self):
+        return self.backend.clock()
+
+    def colors(self):
+        depth = self.backend.colors()
+        if depth != self.last_colors:
+            self.last_colors = depth
+            self.add(dict(colors=depth))
+        return depth
+
+def load_recording(filename):
+    "Return the list of records in a session log."
+    import json
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class Replay(Headless):
+    """A Headless terminal reading the input of a recorded session; with
+    realtime, each read waits until its time in the recording comes.
+    Its output accumulates in `written`; the recording's is `recorded`."""
+
+    def __init__(self, filename, realtime=False):
+        import random
+        records = load_recording(filename)
+        inputs = [r for r in records if 'in' in r]
+        sizes = [r['size'] for r in records if 'size' in r] or [(24, 80)]
+        depths = [r['colors'] for r in records if 'colors' in r] or [2**24]
+        Headless.__init__(self, [replayed_input(r) for r in inputs], *sizes[0],
+                          colors=depths[0])
+        self.times = collections.deque(r['t'] for r in inputs)
+        self.realtime = realtime
+        self.start = None
+        self.now = 0            # The recorded time of the latest read.
+        self.recorded = ''.join(r['out'] for r in records if 'out' in r)
+        self.written = []
+        for r in records:
+            if 'seed' in r:
+                random.seed(r['seed'])
+
+    def enter(self, name):
+        if self.start is None:
+            self.start = time.time()
+        Headless.enter(self, name)
+
+    def write(self, s):
+        self.written.append(s)
+        Headless.write(self, s)
+
+    def read(self, timeout):
+        if self.times:
+            self.now = self.times.popleft()
+            if self.realtime and self.start is not None:
+                time.sleep(max(0, self.start + self.now - time.time()))
+        return Headless.read(self, timeout)
+
+    def clock(self):
+        "At full speed, time passes only as the recorded reads say."
+        if self.realtime or self.start is None:
+            return time.time()
+        return self.start + self.now
+
+def replayed_input(record):
+    data = record['in']
+    return data.encode('latin-1') if record.get('bytes') else data
+
+if os.environ.get('STURM_RECORD'):
+    record(open(os.environ['STURM_RECORD'], 'w', 1)) # (Line-buffered.)
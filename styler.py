@@ -89,7 +89,7 @@ class Cell(object):
         expr = repr(self.text)
         expr = uncall(self.bg, expr)
         expr = uncall(self.fg, expr)
-        for style in sorted(self.styles): # (sorted for determinism)
+        for style in sorted(self.styles, key=lambda style: style.__name__): # (sorted for determinism)
             expr = uncall(style, expr)
         return expr
 
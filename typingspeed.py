@@ -7,6 +7,7 @@ import time
 import sturm
 
 def main(argv):
+    sturm.bracketed_paste = True
     with sturm.cbreak_mode():
         interact()
     return 0
@@ -19,19 +20,24 @@ def show(t, body):
     
 def interact():
     show(0, "(Start typing...)")
-    strokes = sturm.get_key()
+    strokes = type_in('', sturm.get_keys())
     start = time.time()
-    while True:
+    while strokes is not None:
         show(time.time() - start, strokes)
-        key = sturm.get_key(timeout=0.2)
-        if key is None:
-            continue
-        elif key == sturm.esc:
-            break
+        strokes = type_in(strokes, sturm.get_keys(timeout=0.2))
+
+def type_in(strokes, keys):
+    "Return strokes with keys applied, or None if one was Esc."
+    for key in keys:
+        if key == sturm.esc:
+            return None
         elif key == 'backspace':
             strokes = strokes[:-1]
+        elif key[0] == 'paste':
+            strokes += key[1]
         elif len(key) == 1:   # an ordinary key, not special like PgUp
             strokes += key
+    return strokes
 
 if __name__ == '__main__':
     import sys